@@ -4,25 +4,25 @@
 """
 
 import streamlit as st
+import html
 import os
 import sys
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
-import yaml
 
-# 添加项目根目录到Python路径
-project_root = Path(__file__).parent
-sys.path.insert(0, str(project_root))
-
-# 加载环境变量
-load_dotenv()
+# 添加项目根目录到Python路径（rerun时避免重复插入）
+project_root = str(Path(__file__).parent)
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
 
 # 导入自定义模块
 from core.generator import NovelGenerator
 from core.memory_system import SmartMemory
 from core.consistency import ConsistencyChecker
 from core.summarizer import SmartSummarizer
-from utils.file_utils import save_json, ensure_directories
+from core.async_client import submit_async, create_semaphore
+from utils.file_utils import save_json, ensure_directories, read_file, write_file, load_yaml
 from auth import check_api_key
 
 # 页面配置
@@ -38,17 +38,23 @@ st.set_page_config(
     }
 )
 
+# 加载环境变量（每个进程只读取一次.env）
+@st.cache_resource(show_spinner=False)
+def load_env():
+    load_dotenv()
+    return True
+
+load_env()
+
 # 加载配置
 @st.cache_resource
 def load_config():
-    with open('config.yaml', 'r', encoding='utf-8') as f:
-        return yaml.safe_load(f)
+    return load_yaml('config.yaml') or {}
 
 config = load_config()
 
-# 自定义CSS样式
-def load_css():
-    st.markdown("""
+# 自定义CSS样式（模块级常量，rerun时无需重建）
+_CSS = """
     <style>
         /* 主标题样式 */
         .main-header {
@@ -68,6 +74,20 @@ def load_css():
             margin-bottom: 2rem;
         }
         
+        /* 特性卡片网格 */
+        .feature-grid {
+            display: grid;
+            grid-template-columns: repeat(4, 1fr);
+            gap: 1rem;
+        }
+        
+        /* 人物卡片网格 */
+        .character-grid {
+            display: grid;
+            grid-template-columns: repeat(3, 1fr);
+            gap: 1rem;
+        }
+        
         /* 卡片样式 */
         .metric-card {
             background: #000000;
@@ -149,16 +169,124 @@ def load_css():
             border-radius: 4px;
         }
     </style>
-    """, unsafe_allow_html=True)
+    """
+
+# 主标题与特性卡片
+_HEADER_HTML = (
+    '<h1 class="main-header">📚 百万字小说AI创作器</h1>'
+    '<p class="sub-header">✨ 让AI帮你解决长篇小说的前后一致性问题</p>'
+)
+
+_FEATURE_CARDS_HTML = """
+    <div class="feature-grid">
+        <div class="metric-card">
+            <h3>🧠 智能记忆</h3>
+            <p>分层记忆系统，解决百万字一致性</p>
+        </div>
+        <div class="metric-card">
+            <h3>🎯 一键生成</h3>
+            <p>从创意到完整框架自动生成</p>
+        </div>
+        <div class="metric-card">
+            <h3>🔍 实时检查</h3>
+            <p>多维度验证保证内容连贯性</p>
+        </div>
+        <div class="metric-card">
+            <h3>📊 进度追踪</h3>
+            <p>可视化监控创作进度和质量</p>
+        </div>
+    </div>
+    """
+
+# 侧边栏选项（模块级常量，rerun时无需重建）
+WORD_OPTIONS = {
+    "10万字": 100000,
+    "30万字": 300000,
+    "50万字": 500000,
+    "80万字": 800000,
+    "100万字": 1000000,
+    "200万字": 2000000
+}
+WORD_OPTION_LABELS = tuple(WORD_OPTIONS)
+NOVEL_TYPES = ("玄幻", "仙侠", "都市", "科幻", "悬疑", "言情", "历史", "军事", "其他")
+WRITING_STYLES = ("轻松幽默", "严肃正剧", "文艺细腻", "快节奏", "慢热细腻", "群像描写")
+CONSISTENCY_LEVELS = ("宽松", "标准", "严格")
+
+# 一致性检查结果的展示顺序与标签
+CONSISTENCY_SECTIONS = (
+    ('character_consistency', "人物一致性"),
+    ('plot_consistency', "情节连贯性"),
+    ('worldview_consistency', "世界观统一性"),
+)
+
+# 质量评估指标（暂为固定展示值）
+QUALITY_METRICS = (
+    ("人物塑造", "8.5/10"),
+    ("情节设计", "7.8/10"),
+    ("文笔质量", "8.2/10"),
+)
+
+def load_css():
+    st.markdown(_CSS, unsafe_allow_html=True)
+
+@st.cache_data(ttl=300, show_spinner=False)
+def load_chapter(path: str) -> str:
+    """从磁盘按需读取章节正文"""
+    return read_file(path) or ""
+
+def get_chapter_content(chapter_meta: dict) -> str:
+    """获取章节正文（写盘失败时正文保留在元数据中）"""
+    if 'content' in chapter_meta:
+        return chapter_meta['content']
+    return load_chapter(chapter_meta.get('path', ''))
+
+@st.cache_resource
+def get_io_pool():
+    """章节写盘等后台任务使用的线程池"""
+    return ThreadPoolExecutor(max_workers=2)
+
+def build_character_search_blobs(characters: list) -> list:
+    """预先拼接每个人物的小写检索文本，搜索时只需一次子串匹配"""
+    return [
+        " ".join(str(value) for value in character.values()).lower()
+        if isinstance(character, dict) else ""
+        for character in characters
+    ]
+
+def chapter_file_path(outline: dict, chapter_number: int) -> str:
+    """章节正文的保存路径"""
+    title_safe = "".join(c for c in outline.get('title', 'novel') if c.isalnum() or c in " _-")
+    return f"./outputs/novels/{title_safe or 'novel'}_chapter_{chapter_number}.txt"
+
+@st.cache_resource(show_spinner=False)
+def get_components(api_key: str):
+    """按API密钥缓存核心组件，避免每次rerun重复构建"""
+    generator = NovelGenerator(api_key)
+    
+    # 初始化记忆系统（如果失败，创建简化版本）
+    try:
+        memory = SmartMemory()
+    except:
+        # 创建简化记忆系统
+        class SimpleMemory:
+            def get_context(self, chapter_num): return ""
+            def update_with_chapter(self, chapter_num, chapter): pass
+            def save_characters(self, characters): pass
+            def save_chapter_plan(self, plan): pass
+            def get_chapter_plan(self): return []
+        memory = SimpleMemory()
+    
+    return generator, memory, ConsistencyChecker(), SmartSummarizer(generator.llm)
 
 class NovelCreatorApp:
     def __init__(self):
-        self.api_key = None
-        self.generator = None
-        self.memory = None
-        self.consistency_checker = None
-        self.summarizer = None
         self.init_session_state()
+        # 从session恢复已初始化的组件（rerun时无需重建）
+        self.api_key = st.session_state.get('api_key')
+        self.generator = st.session_state.get('generator')
+        self.memory = st.session_state.get('memory')
+        self.consistency_checker = st.session_state.get('consistency_checker')
+        self.summarizer = st.session_state.get('summarizer')
     
     def init_session_state(self):
         """初始化session state"""
@@ -184,20 +312,15 @@ class NovelCreatorApp:
             # 保存API密钥到session
             st.session_state.api_key = api_key
             
-            # 初始化生成器（核心组件）
-            st.session_state.generator = NovelGenerator(api_key)
+            # 获取缓存的核心组件
+            (self.generator, self.memory,
+             self.consistency_checker, self.summarizer) = get_components(api_key)
+            self.api_key = api_key
             
-            # 初始化记忆系统（如果失败，创建简化版本）
-            try:
-                st.session_state.memory = SmartMemory()
-            except:
-                # 创建简化记忆系统
-                class SimpleMemory:
-                    def get_context(self, chapter_num): return ""
-                    def update_with_chapter(self, chapter_num, chapter): pass
-                    def save_characters(self, characters): pass
-                    def save_chapter_plan(self, plan): pass
-                st.session_state.memory = SimpleMemory()
+            st.session_state.generator = self.generator
+            st.session_state.memory = self.memory
+            st.session_state.consistency_checker = self.consistency_checker
+            st.session_state.summarizer = self.summarizer
             
             st.session_state.memory_initialized = True
             return True
@@ -236,35 +359,26 @@ class NovelCreatorApp:
             st.markdown("### 🎯 创作参数")
             
             # 目标字数选择
-            word_options = {
-                "10万字": 100000,
-                "30万字": 300000,
-                "50万字": 500000,
-                "80万字": 800000,
-                "100万字": 1000000,
-                "200万字": 2000000
-            }
-            
             selected_word_label = st.selectbox(
                 "目标字数",
-                list(word_options.keys()),
+                WORD_OPTION_LABELS,
                 index=0
             )
             
-            target_words = word_options[selected_word_label]
+            target_words = WORD_OPTIONS[selected_word_label]
             st.session_state.progress['target_words'] = target_words
             
             # 小说类型选择
             novel_type = st.selectbox(
                 "小说类型",
-                ["玄幻", "仙侠", "都市", "科幻", "悬疑", "言情", "历史", "军事", "其他"],
+                NOVEL_TYPES,
                 index=0
             )
             
             # 写作风格选择
             writing_style = st.selectbox(
                 "写作风格",
-                ["轻松幽默", "严肃正剧", "文艺细腻", "快节奏", "慢热细腻", "群像描写"],
+                WRITING_STYLES,
                 index=1
             )
             
@@ -288,7 +402,7 @@ class NovelCreatorApp:
                 
                 consistency_level = st.select_slider(
                     "一致性检查强度",
-                    options=["宽松", "标准", "严格"],
+                    options=CONSISTENCY_LEVELS,
                     value="标准"
                 )
             
@@ -304,43 +418,10 @@ class NovelCreatorApp:
     
     def render_main_header(self):
         """渲染主标题"""
-        st.markdown('<h1 class="main-header">📚 百万字小说AI创作器</h1>', unsafe_allow_html=True)
-        st.markdown('<p class="sub-header">✨ 让AI帮你解决长篇小说的前后一致性问题</p>', unsafe_allow_html=True)
-        
-        # 特性卡片
-        col1, col2, col3, col4 = st.columns(4)
-        
-        with col1:
-            st.markdown("""
-            <div class="metric-card">
-                <h3>🧠 智能记忆</h3>
-                <p>分层记忆系统，解决百万字一致性</p>
-            </div>
-            """, unsafe_allow_html=True)
-        
-        with col2:
-            st.markdown("""
-            <div class="metric-card">
-                <h3>🎯 一键生成</h3>
-                <p>从创意到完整框架自动生成</p>
-            </div>
-            """, unsafe_allow_html=True)
+        st.markdown(_HEADER_HTML, unsafe_allow_html=True)
         
-        with col3:
-            st.markdown("""
-            <div class="metric-card">
-                <h3>🔍 实时检查</h3>
-                <p>多维度验证保证内容连贯性</p>
-            </div>
-            """, unsafe_allow_html=True)
-        
-        with col4:
-            st.markdown("""
-            <div class="metric-card">
-                <h3>📊 进度追踪</h3>
-                <p>可视化监控创作进度和质量</p>
-            </div>
-            """, unsafe_allow_html=True)
+        # 特性卡片（一次输出）
+        st.markdown(_FEATURE_CARDS_HTML, unsafe_allow_html=True)
     
     def render_creative_input(self):
         """渲染创意输入区域"""
@@ -430,65 +511,33 @@ class NovelCreatorApp:
                 
                 progress_bar.progress(40)
                 
-                # 2. 生成人物 - 简化处理
-                status_text.text("👥 正在生成人物设定...")
-                characters = []
-                try:
-                    characters = st.session_state.generator.generate_characters(outline)
-                    if not isinstance(characters, list):
-                        characters = []
-                except:
-                    characters = []
+                # 2. 人物设定与章节计划互不依赖，并发执行
+                status_text.text("👥 正在生成人物设定并制定章节计划...")
+                generator = st.session_state.generator
                 
-                progress_bar.progress(70)
+                async def generate_characters():
+                    try:
+                        result = await generator.generate_characters_async(outline)
+                        return result if isinstance(result, list) else []
+                    except:
+                        return []
                 
-                # 3. 生成章节计划 - 简单实现
-                # 修改章节计划生成部分
-                status_text.text("📖 正在制定章节计划...")
-                chapter_plan = []
-                try:
-                    target_words = params['target_words']
-                    estimated_chapters = max(10, target_words // 3000)
-                    chapter_plan = []
-                    
-                    # 如果有卷结构，按卷分配章节
-                    if isinstance(outline, dict) and 'volumes' in outline and outline['volumes']:
-                        volumes = outline['volumes']
-                        chapter_counter = 1
-                        for volume in volumes:
-                            volume_name = volume.get('volume_name', f"第{volume.get('volume_number', 1)}卷")
-                            vol_chapters = volume.get('estimated_chapters', 10)
-                            
-                            for i in range(vol_chapters):
-                                if chapter_counter > estimated_chapters:
-                                    break
-                                    
-                                chapter_plan.append({
-                                    "章节": chapter_counter,
-                                    "卷": volume_name,
-                                    "目标字数": 3000,
-                                    "状态": "待生成",
-                                    "章节名": f"第{chapter_counter}章"
-                                })
-                                chapter_counter += 1
-                    else:
-                        # 没有卷结构，简单生成
-                        for i in range(1, estimated_chapters + 1):
-                            chapter_plan.append({
-                                "章节": i,
-                                "卷": f"第{(i-1)//10 + 1}卷",  # 每10章一卷
-                                "目标字数": 3000,
-                                "状态": "待生成",
-                                "章节名": f"第{i}章"
-                            })
-                except:
-                    chapter_plan = []
+                characters_future = submit_async(generate_characters())
+                plan_future = get_io_pool().submit(self.build_chapter_plan, outline, params['target_words'])
+                for done_count, _ in enumerate(as_completed([characters_future, plan_future]), 1):
+                    progress_bar.progress(40 + 30 * done_count)
+                
+                characters = characters_future.result()
+                chapter_plan = plan_future.result()
                 
                 progress_bar.progress(100)
                 
                 # 保存结果到session_state
                 st.session_state.generated_outline = outline
                 st.session_state.characters = characters
+                st.session_state.character_search_blobs = build_character_search_blobs(characters)
+                # 框架已更换，上次的一致性检查结果失效
+                st.session_state.pop('consistency_results', None)
                 
                 # 保存到记忆系统（如果已初始化）
                 if hasattr(st.session_state, 'memory') and st.session_state.memory:
@@ -527,6 +576,46 @@ class NovelCreatorApp:
                     'success': True
                 }
 
+    def build_chapter_plan(self, outline, target_words):
+        """根据大纲的卷结构制定章节计划"""
+        try:
+            estimated_chapters = max(10, target_words // 3000)
+            chapter_plan = []
+            
+            # 如果有卷结构，按卷分配章节
+            if isinstance(outline, dict) and 'volumes' in outline and outline['volumes']:
+                volumes = outline['volumes']
+                chapter_counter = 1
+                for volume in volumes:
+                    volume_name = volume.get('volume_name', f"第{volume.get('volume_number', 1)}卷")
+                    vol_chapters = volume.get('estimated_chapters', 10)
+                    
+                    for i in range(vol_chapters):
+                        if chapter_counter > estimated_chapters:
+                            break
+                            
+                        chapter_plan.append({
+                            "章节": chapter_counter,
+                            "卷": volume_name,
+                            "目标字数": 3000,
+                            "状态": "待生成",
+                            "章节名": f"第{chapter_counter}章"
+                        })
+                        chapter_counter += 1
+            else:
+                # 没有卷结构，简单生成
+                for i in range(1, estimated_chapters + 1):
+                    chapter_plan.append({
+                        "章节": i,
+                        "卷": f"第{(i-1)//10 + 1}卷",  # 每10章一卷
+                        "目标字数": 3000,
+                        "状态": "待生成",
+                        "章节名": f"第{i}章"
+                    })
+            return chapter_plan
+        except:
+            return []
+
     def render_generated_content(self, generated_data):
         """渲染生成的内容"""
         if not generated_data['success']:
@@ -585,7 +674,7 @@ class NovelCreatorApp:
                 selected_chapter = st.selectbox("选择章节", chapter_options)
                 
                 if selected_chapter and selected_chapter in st.session_state.chapters:
-                    chapter_content = st.session_state.chapters[selected_chapter].get('content', '')
+                    chapter_content = get_chapter_content(st.session_state.chapters[selected_chapter])
                     chapter_title = st.session_state.chapters[selected_chapter].get('title', f'第{selected_chapter}章')
                     
                     # 创建下载按钮
@@ -609,7 +698,7 @@ class NovelCreatorApp:
                     for chap_num in sorted(st.session_state.chapters.keys()):
                         chapter = st.session_state.chapters[chap_num]
                         all_content += f"# {chapter.get('title', f'第{chap_num}章')}\n\n"
-                        all_content += chapter.get('content', '') + "\n\n"
+                        all_content += get_chapter_content(chapter) + "\n\n"
                     
                     st.download_button(
                         label="下载全部章节",
@@ -709,59 +798,68 @@ class NovelCreatorApp:
         col1, col2 = st.columns([1, 3])
         with col1:
             search_term = st.text_input("搜索人物", placeholder="输入姓名或特征", key="character_search")
+        with col2:
+            show_details = st.toggle("显示人物详情", value=False, key="character_details")
+        
+        # 检索文本随人物列表一起缓存，按键搜索时不再逐个序列化
+        blobs = st.session_state.get('character_search_blobs')
+        if blobs is None or len(blobs) != len(characters):
+            blobs = build_character_search_blobs(characters)
+            st.session_state.character_search_blobs = blobs
+        
+        query = search_term.lower() if search_term else ""
+        visible_characters = [
+            character for character, blob in zip(characters, blobs)
+            if isinstance(character, dict) and (not query or query in blob)
+        ]
+        
+        # 显示人物卡片（拼接后一次输出）
+        cards = []
+        for character in visible_characters:
+            # 安全获取字符数据
+            name = html.escape(str(character.get('name', '未知')))
+            identity = html.escape(str(character.get('identity', '')))
+            age = html.escape(str(character.get('age', '')))
+            personality = html.escape(str(character.get('personality', ''))[:50])
+            
+            cards.append(
+                f'<div class="metric-card"><h4>{name}</h4>'
+                f'<p><strong>身份:</strong> {identity}</p>'
+                f'<p><strong>年龄:</strong> {age}</p>'
+                f'<p><strong>性格:</strong> {personality}...</p></div>'
+            )
         
-        # 显示人物卡片
-        cols = st.columns(3)
+        st.markdown(f'<div class="character-grid">{"".join(cards)}</div>', unsafe_allow_html=True)
         
-        for idx, character in enumerate(characters):
-            if not isinstance(character, dict):
-                continue
+        if not show_details:
+            return
+        
+        for character in visible_characters:
+            with st.expander(f"{character.get('name', '未知')} - 详情"):
+                # 背景故事
+                background = character.get('background', '')
+                if background:
+                    st.write(f"**背景故事**: {background}")
                 
-            if search_term and search_term.lower() not in str(character).lower():
-                continue
-            
-            with cols[idx % 3]:
-                with st.container():
-                    # 安全获取字符数据
-                    name = character.get('name', '未知')
-                    identity = character.get('identity', '')
-                    age = character.get('age', '')
-                    personality = character.get('personality', '')
-                    
-                    st.markdown(f"""
-                    <div class="metric-card">
-                        <h4>{name}</h4>
-                        <p><strong>身份:</strong> {identity}</p>
-                        <p><strong>年龄:</strong> {age}</p>
-                        <p><strong>性格:</strong> {personality[:50]}...</p>
-                    </div>
-                    """, unsafe_allow_html=True)
-                    
-                    with st.expander("查看详情"):
-                        # 背景故事
-                        background = character.get('background', '')
-                        if background:
-                            st.write(f"**背景故事**: {background}")
-                        
-                        # 核心动机
-                        motivation = character.get('motivation', '')
-                        if motivation:
-                            st.write(f"**核心动机**: {motivation}")
-                        
-                        # 成长弧线
-                        growth_arc = character.get('growth_arc', '')
-                        if growth_arc:
-                            st.write(f"**成长弧线**: {growth_arc}")
-                        
-                        # 人物关系
-                        relationships = character.get('relationships', [])
-                        if relationships:
-                            st.write("**人物关系**:")
-                            if isinstance(relationships, list):
-                                for rel in relationships[:5]:  # 最多显示5个
-                                    st.write(f"  • {rel}")
-                            elif isinstance(relationships, str):
-                                st.write(f"  {relationships}")
+                # 核心动机
+                motivation = character.get('motivation', '')
+                if motivation:
+                    st.write(f"**核心动机**: {motivation}")
+                
+                # 成长弧线
+                growth_arc = character.get('growth_arc', '')
+                if growth_arc:
+                    st.write(f"**成长弧线**: {growth_arc}")
+                
+                # 人物关系
+                relationships = character.get('relationships', [])
+                if relationships:
+                    st.write("**人物关系**:")
+                    if isinstance(relationships, list):
+                        for rel in relationships[:5]:  # 最多显示5个
+                            st.write(f"  • {rel}")
+                    elif isinstance(relationships, str):
+                        st.write(f"  {relationships}")
     
     def render_chapter_plan_tab(self, chapter_plan):
         """渲染章节计划标签页"""
@@ -805,59 +903,113 @@ class NovelCreatorApp:
         
         try:
             generated_chapters = []
+            chapter_numbers = [start_chapter + i for i in range(batch_size)]
             
-            for i in range(batch_size):
-                chapter_num = start_chapter + i
-                
-                status_text.text(f"正在生成第 {chapter_num} 章...")
-                
-                # 获取上下文
+            # 预先获取上下文（只依赖已保存的记忆，可在并发请求前一次取齐）
+            contexts = {}
+            for chapter_num in chapter_numbers:
                 context = ""
                 if hasattr(st.session_state, 'memory') and st.session_state.memory:
                     try:
                         context = st.session_state.memory.get_context(chapter_num)
                     except:
                         context = ""
+                contexts[chapter_num] = context
+            
+            generator = st.session_state.generator
+            outline = st.session_state.generated_outline
+            characters = st.session_state.get('characters', [])
+            concurrency = config.get('generation', {}).get('max_batch_size', 3)
+            
+            # 请求在共享的后台事件循环中并发执行，界面更新留在脚本线程
+            semaphore = create_semaphore(concurrency)
+            
+            async def generate_one(chapter_num):
+                async with semaphore:
+                    try:
+                        chapter = await generator.generate_chapter_async(
+                            chapter_number=chapter_num,
+                            outline=outline,
+                            characters=characters,
+                            context=contexts[chapter_num],
+                            target_words=chapter_words
+                        )
+                        return chapter_num, chapter, None
+                    except Exception as e:
+                        return chapter_num, None, e
+            
+            status_text.text(f"正在并发生成第 {chapter_numbers[0]}-{chapter_numbers[-1]} 章...")
+            futures = [submit_async(generate_one(chapter_num)) for chapter_num in chapter_numbers]
+            
+            # 按完成顺序更新进度
+            batch_results = {}
+            for done_count, future in enumerate(as_completed(futures), 1):
+                chapter_num, chapter, error = future.result()
+                batch_results[chapter_num] = (chapter, error)
+                status_text.text(f"已完成 {done_count}/{batch_size} 章")
+                progress_bar.progress(done_count / batch_size)
+            
+            # 按章节顺序写入session；章节文件交给后台线程写盘，不阻塞界面渲染
+            io_pool = get_io_pool()
+            pending_writes = []
+            
+            for i, chapter_num in enumerate(chapter_numbers):
+                chapter, error = batch_results[chapter_num]
                 
-                # 生成章节 - 简化调用
-                try:
-                    chapter = st.session_state.generator.generate_chapter(
-                        chapter_number=chapter_num,
-                        outline=st.session_state.generated_outline,
-                        characters=st.session_state.get('characters', []),
-                        context=context,
-                        target_words=chapter_words
-                    )
-                    
-                    # 确保章节有内容
-                    if not chapter.get('content'):
-                        chapter['content'] = f"第{chapter_num}章内容（等待详细生成）..."
-                    
-                    # 保存到session
-                    if 'chapters' not in st.session_state:
-                        st.session_state.chapters = {}
-                    st.session_state.chapters[chapter_num] = chapter
-                    
-                    # 更新记忆
-                    if hasattr(st.session_state, 'memory') and st.session_state.memory:
-                        try:
-                            st.session_state.memory.update_with_chapter(chapter_num, chapter)
-                        except:
-                            pass
-                    
-                    generated_chapters.append(chapter)
-                    
-                    # 实时显示结果
-                    with results_container:
-                        with st.expander(f"第{chapter_num}章: {chapter.get('title', f'第{chapter_num}章')}", expanded=(i==0)):
-                            st.text_area("内容", chapter.get('content', ''), height=150, key=f"chapter_{chapter_num}")
-                    
-                except Exception as e:
-                    st.error(f"第{chapter_num}章生成失败: {str(e)[:100]}")
+                if error is not None:
+                    st.error(f"第{chapter_num}章生成失败: {str(error)[:100]}")
+                    continue
+                
+                # 确保章节有内容
+                if not chapter.get('content'):
+                    chapter['content'] = f"第{chapter_num}章内容（等待详细生成）..."
+                
+                # 正文写入磁盘，session中只保留元数据
+                content = chapter['content']
+                word_count = len(content)
+                chapter_path = chapter_file_path(outline, chapter_num)
+                chapter_meta = {
+                    'title': chapter.get('title', f'第{chapter_num}章'),
+                    'summary': chapter.get('summary', ''),
+                    'path': chapter_path,
+                    'words': word_count
+                }
+                pending_writes.append(
+                    (chapter_meta, content, io_pool.submit(write_file, chapter_path, content))
+                )
+                
+                if 'chapters' not in st.session_state:
+                    st.session_state.chapters = {}
+                previous = st.session_state.chapters.get(chapter_num)
+                st.session_state.chapters[chapter_num] = chapter_meta
+                # 章节有变化，上次的一致性检查结果失效
+                st.session_state.pop('consistency_results', None)
                 
-                # 更新进度
-                progress = (i + 1) / batch_size
-                progress_bar.progress(progress)
+                # 更新进度（重新生成的章节替换旧字数）
+                progress = st.session_state.progress
+                if previous:
+                    progress['completed_words'] -= previous.get('words', 0)
+                else:
+                    progress['chapters_count'] += 1
+                progress['completed_words'] += word_count
+                
+                generated_chapters.append((chapter_num, chapter))
+                
+                # 显示结果
+                with results_container:
+                    with st.expander(f"第{chapter_num}章: {chapter.get('title', f'第{chapter_num}章')}", expanded=(i==0)):
+                        st.text_area("内容", content, height=150, key=f"chapter_{chapter_num}")
+            
+            # 章节文件在后台写盘的同时，在脚本线程中按章节顺序更新记忆（记忆系统非线程安全）
+            memory = st.session_state.get('memory')
+            if memory and generated_chapters:
+                self.update_memory_with_chapters(memory, generated_chapters)
+            
+            # 写盘失败的章节把正文保留在元数据中
+            for chapter_meta, content, future in pending_writes:
+                if not future.result():
+                    chapter_meta['content'] = content
+            load_chapter.clear()
             
             status_text.text("✅ 章节生成完成!")
             st.success(f"成功生成 {len(generated_chapters)} 个章节!")
@@ -865,6 +1017,15 @@ class NovelCreatorApp:
         except Exception as e:
             st.error(f"生成过程出错: {str(e)}")
     
+    @staticmethod
+    def update_memory_with_chapters(memory, chapters):
+        """按章节顺序更新记忆（不访问session_state）"""
+        for chapter_num, chapter in chapters:
+            try:
+                memory.update_with_chapter(chapter_num, chapter)
+            except:
+                pass
+    
     def render_consistency_tab(self, outline, characters):
         """渲染一致性检查标签页 - 修复结构问题"""
         st.markdown("### 🔍 一致性检查")
@@ -882,7 +1043,11 @@ class NovelCreatorApp:
             with st.spinner("正在检查..."):
                 try:
                     # 获取章节数据
-                    chapters = st.session_state.chapters if hasattr(st.session_state, 'chapters') else {}
+                    chapter_metas = st.session_state.chapters if hasattr(st.session_state, 'chapters') else {}
+                    chapters = {
+                        chap_num: {**meta, 'content': get_chapter_content(meta)}
+                        for chap_num, meta in chapter_metas.items()
+                    }
                     
                     results = st.session_state.consistency_checker.full_consistency_check(
                         outline=outline,
@@ -890,9 +1055,13 @@ class NovelCreatorApp:
                         chapters=chapters
                     )
                     
-                    self.display_consistency_results(results)
+                    st.session_state.consistency_results = results
                 except Exception as e:
                     st.error(f"一致性检查失败: {str(e)}")
+        
+        # 复用上次检查结果，rerun时无需重新计算
+        if st.session_state.get('consistency_results'):
+            self.display_consistency_results(st.session_state.consistency_results)
     
     def display_consistency_results(self, results):
         """显示一致性检查结果 - 修复结构问题"""
@@ -900,62 +1069,25 @@ class NovelCreatorApp:
             st.error("一致性检查结果格式错误")
             return
         
-        col1, col2, col3 = st.columns(3)
+        columns = st.columns(len(CONSISTENCY_SECTIONS))
         
-        with col1:
-            # 人物一致性
-            character_result = results.get('character_consistency', {})
-            if isinstance(character_result, dict):
-                score = character_result.get('score', 0)
-                issues = character_result.get('issues', [])
-            else:
-                score = 0
-                issues = []
-            
-            st.metric("人物一致性", f"{score}%")
-            
-            if issues and isinstance(issues, list):
-                if len(issues) > 0:
-                    st.warning("⚠️ 人物一致性问题:")
+        for col, (key, label) in zip(columns, CONSISTENCY_SECTIONS):
+            with col:
+                section = results.get(key, {})
+                if isinstance(section, dict):
+                    score = section.get('score', 0)
+                    issues = section.get('issues', [])
+                else:
+                    score = 0
+                    issues = []
+                
+                st.metric(label, f"{score}%")
+                
+                if issues and isinstance(issues, list):
+                    st.warning(f"⚠️ {label}问题:")
                     for issue in issues[:3]:  # 最多显示3个
                         st.write(f"• {issue}")
         
-        with col2:
-            # 情节连贯性
-            plot_result = results.get('plot_consistency', {})
-            if isinstance(plot_result, dict):
-                score = plot_result.get('score', 0)
-                issues = plot_result.get('issues', [])
-            else:
-                score = 0
-                issues = []
-            
-            st.metric("情节连贯性", f"{score}%")
-            
-            if issues and isinstance(issues, list):
-                if len(issues) > 0:
-                    st.warning("⚠️ 情节连贯性问题:")
-                    for issue in issues[:3]:
-                        st.write(f"• {issue}")
-        
-        with col3:
-            # 世界观统一性
-            worldview_result = results.get('worldview_consistency', {})
-            if isinstance(worldview_result, dict):
-                score = worldview_result.get('score', 0)
-                issues = worldview_result.get('issues', [])
-            else:
-                score = 0
-                issues = []
-            
-            st.metric("世界观统一性", f"{score}%")
-            
-            if issues and isinstance(issues, list):
-                if len(issues) > 0:
-                    st.warning("⚠️ 世界观统一性问题:")
-                    for issue in issues[:3]:
-                        st.write(f"• {issue}")
-        
         # 总体评分
         overall = results.get('overall_score', 0)
         if not isinstance(overall, (int, float)):
@@ -975,21 +1107,19 @@ class NovelCreatorApp:
         """渲染进度追踪区域"""
         st.markdown("## 📊 创作进度")
         
+        # 字数和章节数在生成时增量累计，这里只读取一次
         progress = st.session_state.progress
         target_words = progress['target_words']
         completed_words = progress['completed_words']
         chapters_count = progress['chapters_count']
         
-        # 计算百分比
-        if target_words > 0:
-            percentage = min(100, (completed_words / target_words) * 100)
-        else:
-            percentage = 0
-        
+        # 完成比例只计算一次，进度条与百分比共用
+        ratio = min(1.0, completed_words / target_words) if target_words > 0 else 0.0
+        percentage = ratio * 100
         progress['percentage'] = percentage
         
         # 进度条
-        st.progress(percentage / 100)
+        st.progress(ratio)
         
         # 统计卡片
         col1, col2, col3, col4 = st.columns(4)
@@ -1011,16 +1141,9 @@ class NovelCreatorApp:
             st.markdown("### 📈 质量评估")
             
             # 这里可以添加更复杂的质量评估逻辑
-            col1, col2, col3 = st.columns(3)
-            
-            with col1:
-                st.metric("人物塑造", "8.5/10")
-            
-            with col2:
-                st.metric("情节设计", "7.8/10")
-            
-            with col3:
-                st.metric("文笔质量", "8.2/10")
+            for col, (label, value) in zip(st.columns(len(QUALITY_METRICS)), QUALITY_METRICS):
+                with col:
+                    st.metric(label, value)
     
     def run(self):
         """运行应用"""
@@ -1076,10 +1199,7 @@ def main():
 
 if __name__ == "__main__":
     # 确保目录存在
-    ensure_directories("./outputs")
-    ensure_directories("./outputs/novels")
-    ensure_directories("./outputs/outlines")
-    ensure_directories("./memory")
+    ensure_directories("./outputs/novels", "./outputs/outlines", "./memory")
     
     # 运行应用
     main()
\ No newline at end of file
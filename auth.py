@@ -6,6 +6,19 @@ import streamlit as st
 import requests
 import os
 from typing import Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# 复用连接池，避免每次验证都重新进行TCP/TLS握手
+_SESSION = requests.Session()
+_SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=16,
+        max_retries=Retry(total=2, backoff_factor=0.2)
+    )
+)
 
 class Authentication:
     def __init__(self):
@@ -26,7 +39,7 @@ class Authentication:
                 "max_tokens": 5
             }
             
-            response = requests.post(
+            response = _SESSION.post(
                 f"{self.api_base}/chat/completions",
                 headers=headers,
                 json=test_payload,
@@ -47,10 +60,32 @@ class Authentication:
         """获取API密钥"""
         return st.session_state.get('api_key')
 
+@st.cache_resource
+def _get_auth() -> Authentication:
+    """获取共享的认证实例（无状态，只需构造一次）"""
+    return Authentication()
+
+class _APIKeyRejected(Exception):
+    """API密钥验证未通过"""
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def _check_api_key_cached(api_key: str) -> bool:
+    """验证API密钥；失败时抛出异常，streamlit不缓存异常，因此只有验证通过的结果会被缓存"""
+    if not _get_auth().authenticate(api_key):
+        raise _APIKeyRejected()
+    return True
+
 def check_api_key(api_key: str) -> bool:
-    """检查API密钥有效性"""
-    auth = Authentication()
-    return auth.authenticate(api_key)
+    """
+    检查API密钥有效性
+    
+    验证通过的密钥缓存一小时，避免重复请求；验证失败可能只是超时、限流或服务端错误，
+    不缓存，下次重新验证。
+    """
+    try:
+        return _check_api_key_cached(api_key)
+    except _APIKeyRejected:
+        return False
 
 def save_api_key_to_env(api_key: str):
     """保存API密钥到环境文件"""
@@ -2,14 +2,30 @@
 核心模块 - 百万字小说AI创作器
 """
 
-from .generator import NovelGenerator
-from .memory_system import SmartMemory
-from .consistency import ConsistencyChecker
-from .summarizer import SmartSummarizer
+import importlib
+
+# 按需导入子模块（PEP 562），只用到记忆系统时不会加载LangChain等依赖
+_LAZY_IMPORTS = {
+    'NovelGenerator': '.generator',
+    'SmartMemory': '.memory_system',
+    'ConsistencyChecker': '.consistency',
+    'SmartSummarizer': '.summarizer'
+}
+
+def __getattr__(name):
+    if name in _LAZY_IMPORTS:
+        module = importlib.import_module(_LAZY_IMPORTS[name], __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_IMPORTS))
 
 __all__ = [
     'NovelGenerator',
     'SmartMemory',
     'ConsistencyChecker',
     'SmartSummarizer'
-]
\ No newline at end of file
+]
@@ -0,0 +1,112 @@
+"""
+异步客户端模块
+整个应用共享一个后台事件循环和一个DeepSeek HTTP连接池
+"""
+
+import asyncio
+import atexit
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Coroutine
+
+import httpx
+import openai
+
+DEEPSEEK_BASE_URL = "https://api.deepseek.com/v1"
+
+_lock = threading.Lock()
+_loop = None
+_http_client = None
+_io_executor = None
+
+def get_io_executor() -> ThreadPoolExecutor:
+    """获取共享的磁盘IO线程池（同时作为后台事件循环的默认executor）"""
+    global _io_executor
+    with _lock:
+        if _io_executor is None:
+            _io_executor = ThreadPoolExecutor(
+                max_workers=os.cpu_count() or 4,
+                thread_name_prefix="novel-io"
+            )
+        return _io_executor
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    获取后台事件循环（首次调用时在守护线程中启动）
+
+    httpx.AsyncClient的连接绑定在创建它的事件循环上，
+    所有异步请求都在同一个循环中执行，连接才能在多次批量生成之间复用。
+    """
+    global _loop
+    io_executor = get_io_executor()
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            # run_in_executor(None, ...) 复用同一个线程池，避免重复创建
+            _loop.set_default_executor(io_executor)
+            thread = threading.Thread(
+                target=_loop.run_forever,
+                name="deepseek-async-loop",
+                daemon=True
+            )
+            thread.start()
+        return _loop
+
+def submit_async(coro: Coroutine) -> Future:
+    """
+    把协程提交到后台事件循环
+
+    Args:
+        coro: 协程对象
+
+    Returns:
+        concurrent.futures.Future，可在调用线程中等待结果
+    """
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop())
+
+def run_async(coro: Coroutine, timeout: float = None) -> Any:
+    """在后台事件循环中执行协程并阻塞等待结果"""
+    return submit_async(coro).result(timeout)
+
+def create_semaphore(limit: int) -> asyncio.Semaphore:
+    """在后台事件循环中创建信号量，用于限制并发请求数"""
+    async def _create():
+        return asyncio.Semaphore(limit)
+    return run_async(_create())
+
+def get_http_client() -> httpx.AsyncClient:
+    """获取共享的异步HTTP客户端（支持时启用HTTP/2多路复用）"""
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            limits = httpx.Limits(max_connections=32, max_keepalive_connections=16)
+            try:
+                _http_client = httpx.AsyncClient(http2=True, limits=limits, timeout=120)
+            except ImportError:
+                # 未安装h2时回退到HTTP/1.1
+                _http_client = httpx.AsyncClient(limits=limits, timeout=120)
+        return _http_client
+
+def create_async_openai(api_key: str, timeout: float = 120, max_retries: int = 2) -> openai.AsyncOpenAI:
+    """创建使用共享连接池的DeepSeek异步客户端"""
+    return openai.AsyncOpenAI(
+        api_key=api_key,
+        base_url=DEEPSEEK_BASE_URL,
+        http_client=get_http_client(),
+        timeout=timeout,
+        max_retries=max_retries
+    )
+
+def _shutdown():
+    """进程退出时关闭连接池并停止事件循环"""
+    if _loop is None or not _loop.is_running():
+        return
+    try:
+        if _http_client is not None:
+            run_async(_http_client.aclose(), timeout=5)
+    except Exception:
+        pass
+    _loop.call_soon_threadsafe(_loop.stop)
+
+atexit.register(_shutdown)
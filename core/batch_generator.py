@@ -5,37 +5,109 @@
 
 import streamlit as st
 import asyncio
+import logging
+import statistics
+import threading
 import time
+from collections import deque
 from typing import List, Dict, Any, Callable
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, wait
+from .async_client import submit_async, get_io_executor
 from .generator import NovelGenerator
 from .memory_system import SmartMemory
 from .consistency import ConsistencyChecker
 # Support importing when module is executed as part of the package (relative import)
 # and when executed directly as a script (absolute import).
 try:
-    from ..utils.file_utils import write_file
+    from ..utils.file_utils import write_file, dumps_json, ensure_directories
 except Exception:
     # Fallback to absolute import for direct script execution
-    from utils.file_utils import write_file
+    from utils.file_utils import write_file, dumps_json, ensure_directories
+
+logger = logging.getLogger(__name__)
 
 class BatchChapterGenerator:
     """批量章节生成器"""
     
+    # 自适应并发数的上下限
+    MIN_WORKERS = 1
+    MAX_WORKERS = 32
+    
+    # 视为被限流/超时的错误特征
+    THROTTLE_MARKERS = ('429', 'rate limit', 'ratelimit', 'timeout', 'timed out')
+    
     def __init__(self, generator: NovelGenerator = None, 
                  memory: SmartMemory = None,
-                 consistency_checker: ConsistencyChecker = None):
+                 consistency_checker: ConsistencyChecker = None,
+                 max_workers: int = 3):
         self.generator = generator
         self.memory = memory
         self.consistency_checker = consistency_checker
-        self.max_workers = 3  # 最大并发数
+        # 记忆系统非线程安全：后台线程读取上下文和调用方线程更新记忆时都要持有这把锁
+        self._memory_lock = threading.Lock()
+        # 初始并发请求数（对应配置中的generation.max_batch_size），每批结束后根据延迟和限流情况自动调整
+        self.max_workers = max(self.MIN_WORKERS, min(self.MAX_WORKERS, max_workers))
+        self._semaphore = None
+        self._recent_latencies = deque(maxlen=16)
+        self._recent_throttles = deque(maxlen=16)
+        self._baseline_latency = None
+    
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """获取并发限制信号量（须在共享事件循环中调用，首次使用时创建，之后各批次复用）"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+        return self._semaphore
+    
+    async def _generate_with_limit(self, chapter_number: int, target_words: int,
+                                   outline: Dict[str, Any],
+                                   characters: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """在并发限制内生成单个章节，并记录耗时和是否被限流"""
+        async with self._get_semaphore():
+            started = time.monotonic()
+            result = await self._generate_single_chapter_async(
+                chapter_number, target_words, outline, characters
+            )
+            
+            error = str(result.get('error', '')).lower()
+            throttled = any(marker in error for marker in self.THROTTLE_MARKERS)
+            self._recent_throttles.append(throttled)
+            if result.get('success'):
+                self._recent_latencies.append(time.monotonic() - started)
+            
+            return result
+    
+    def _adjust_concurrency(self):
+        """
+        根据最近的请求情况调整并发数（在两批之间调用）
+        
+        出现限流或超时时减半；延迟稳定时加一。
+        """
+        previous = self.max_workers
+        
+        if any(self._recent_throttles):
+            self.max_workers = max(self.MIN_WORKERS, self.max_workers // 2)
+            self._baseline_latency = None
+        elif len(self._recent_latencies) >= min(self.max_workers, self._recent_latencies.maxlen):
+            median_latency = statistics.median(self._recent_latencies)
+            if self._baseline_latency is None or median_latency <= self._baseline_latency * 1.5:
+                self.max_workers = min(self.MAX_WORKERS, self.max_workers + 1)
+            if self._baseline_latency is None or median_latency < self._baseline_latency:
+                self._baseline_latency = median_latency
+        
+        self._recent_throttles.clear()
+        if self.max_workers != previous:
+            # 下一批使用新的并发数重新创建信号量
+            self._semaphore = None
+            logger.info("🔧 批量生成并发数调整: %d -> %d", previous, self.max_workers)
     
     def generate_batch_chapters(self, 
                               start_chapter: int, 
                               chapters_count: int,
                               words_per_chapter: int = 3000,
                               progress_callback: Callable = None,
-                              status_callback: Callable = None) -> Dict[str, Any]:
+                              status_callback: Callable = None,
+                              outline: Dict[str, Any] = None,
+                              characters: List[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         批量生成多个章节
         
@@ -45,6 +117,8 @@ class BatchChapterGenerator:
             words_per_chapter: 每章字数
             progress_callback: 进度回调函数
             status_callback: 状态回调函数
+            outline: 小说大纲（默认从session_state读取）
+            characters: 人物列表（默认从session_state读取）
             
         Returns:
             生成结果
@@ -63,28 +137,47 @@ class BatchChapterGenerator:
             "failed_count": 0
         }
         
+        # 在调用线程中读取大纲和人物（后台事件循环线程无法访问session_state）
+        if outline is None:
+            outline = st.session_state.get('generated_outline', {})
+        if characters is None:
+            characters = st.session_state.get('characters', [])
+        
         start_time = time.time()
         
         try:
-            # 使用线程池并行生成
-            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-                futures = []
+            # 在共享事件循环中并发生成，并发数由信号量限制；
+            # 同时只保留 2*max_workers 个待完成任务，完成一个再提交下一个
+            end_chapter = start_chapter + chapters_count
+            next_chapter = start_chapter
+            inflight = set()
+            
+            def submit_next():
+                nonlocal next_chapter
+                inflight.add(submit_async(self._generate_with_limit(
+                    next_chapter, words_per_chapter, outline, characters
+                )))
+                next_chapter += 1
+            
+            while next_chapter < end_chapter and len(inflight) < 2 * self.max_workers:
+                submit_next()
+            
+            # 已完成但尚未写入记忆的章节；按章节顺序写入，前面的章节没完成时先等待
+            finished = {}
+            next_to_apply = start_chapter
+            
+            # 处理完成的任务（回调和记忆更新在调用线程中执行，不占用事件循环）
+            completed_count = 0
+            while inflight:
+                done, inflight = wait(inflight, return_when=FIRST_COMPLETED)
                 
-                for i in range(chapters_count):
-                    chapter_num = start_chapter + i
+                for future in done:
+                    if next_chapter < end_chapter:
+                        submit_next()
                     
-                    future = executor.submit(
-                        self._generate_single_chapter,
-                        chapter_num,
-                        words_per_chapter
-                    )
-                    futures.append(future)
-                
-                # 处理完成的任务
-                completed_count = 0
-                for future in as_completed(futures):
                     try:
                         chapter_result = future.result()
+                        finished[chapter_result['chapter_number']] = chapter_result
                         
                         if chapter_result['success']:
                             results['chapters'].append(chapter_result)
@@ -101,16 +194,29 @@ class BatchChapterGenerator:
                                 status_callback(f"已完成 {completed_count}/{chapters_count} 章")
                         else:
                             results['failed_count'] += 1
-                            print(f"❌ 第{chapter_result['chapter_number']}章生成失败: {chapter_result.get('error', '未知错误')}")
+                            logger.error("❌ 第%s章生成失败: %s", chapter_result['chapter_number'], chapter_result.get('error', '未知错误'))
                             
                     except Exception as e:
                         results['failed_count'] += 1
-                        print(f"❌ 章节生成异常: {str(e)}")
+                        logger.error("❌ 章节生成异常: %s", e)
+                
+                while next_to_apply in finished:
+                    self._apply_memory_update(finished.pop(next_to_apply))
+                    next_to_apply += 1
+            
+            # 异常退出、没有返回章节编号的任务不会出现在finished中，剩余章节按顺序补上
+            for chapter_number in sorted(finished):
+                self._apply_memory_update(finished[chapter_number])
+            
+            # 整批章节文件一次提交到IO线程池写盘
+            self._save_chapter_files(results['chapters']).result()
+            
+            self._adjust_concurrency()
             
             results['total_time'] = time.time() - start_time
             
-            # 保存结果
-            self._save_batch_results(results)
+            # 保存结果（后台写盘，不阻塞调用方）
+            self._save_batch_results(results, async_mode=True)
             
             return results
             
@@ -119,13 +225,17 @@ class BatchChapterGenerator:
                 status_callback(f"批量生成失败: {str(e)}")
             raise
     
-    def _generate_single_chapter(self, chapter_number: int, target_words: int) -> Dict[str, Any]:
+    async def _generate_single_chapter_async(self, chapter_number: int, target_words: int,
+                                             outline: Dict[str, Any],
+                                             characters: List[Dict[str, Any]]) -> Dict[str, Any]:
         """
-        生成单个章节
+        异步生成单个章节
         
         Args:
             chapter_number: 章节编号
             target_words: 目标字数
+            outline: 小说大纲
+            characters: 人物列表
             
         Returns:
             章节生成结果
@@ -135,18 +245,17 @@ class BatchChapterGenerator:
             if not self.generator or not self.memory:
                 raise ValueError("生成器或记忆系统未初始化")
             
-            # 获取上下文
-            context = self.memory.get_context(chapter_number)
-            
-            # 获取大纲和人物
-            outline = st.session_state.get('generated_outline', {})
-            characters = st.session_state.get('characters', [])
-            
             if not outline or not characters:
                 raise ValueError("请先生成小说框架")
             
+            # 读取记忆、一致性检查都是同步操作，放到线程池中执行，不阻塞其他章节的请求
+            loop = asyncio.get_running_loop()
+            
+            # 获取上下文
+            context = await loop.run_in_executor(None, self._read_context, chapter_number)
+            
             # 生成章节
-            chapter = self.generator.generate_chapter(
+            chapter = await self.generator.generate_chapter_async(
                 chapter_number=chapter_number,
                 outline=outline,
                 characters=characters,
@@ -157,37 +266,32 @@ class BatchChapterGenerator:
             # 一致性检查
             consistency_result = {}
             if self.consistency_checker:
-                consistency_result = self.consistency_checker.check_chapter_consistency(
-                    chapter, 
-                    {
-                        'outline': outline,
-                        'characters': characters,
-                        'previous_summaries': self.memory._get_recent_summaries(chapter_number, 3)
-                    }
+                consistency_result = await loop.run_in_executor(
+                    None, self._check_consistency, chapter, chapter_number, outline, characters
                 )
             
-            # 更新记忆
-            self.memory.update_with_chapter(chapter_number, chapter)
+            content = chapter.get('content', '')
             
-            # 保存章节文件
+            # 章节文件由调用方在整批完成后统一写盘
+            pending_file = None
             if outline.get('title'):
                 title_safe = "".join(c for c in outline['title'] if c.isalnum() or c in " _-")
                 chapter_file = f"./outputs/novels/{title_safe}_chapter_{chapter_number}.txt"
                 
                 # 构建章节内容文本
-                chapter_text = f"# 第{chapter_number}章: {chapter.get('title', '')}\n\n"
-                chapter_text += chapter.get('content', '')
-                
-                write_file(chapter_file, chapter_text)
+                chapter_text = f"# 第{chapter_number}章: {chapter.get('title', '')}\n\n{content}"
+                pending_file = (chapter_file, chapter_text)
             
             return {
                 "success": True,
                 "chapter_number": chapter_number,
                 "title": chapter.get('title', f"第{chapter_number}章"),
-                "word_count": len(chapter.get('content', '')),
+                "word_count": len(content),
                 "summary": chapter.get('summary', ''),
                 "consistency_check": consistency_result,
-                "file_saved": True,
+                "file_saved": False,
+                "pending_file": pending_file,
+                "pending_memory": chapter,  # 由调用方按章节顺序写入记忆
                 "generation_time": time.strftime("%Y-%m-%d %H:%M:%S")
             }
             
@@ -199,31 +303,111 @@ class BatchChapterGenerator:
                 "generation_time": time.strftime("%Y-%m-%d %H:%M:%S")
             }
     
-    def _save_batch_results(self, results: Dict[str, Any]):
-        """保存批量生成结果"""
+    def _read_context(self, chapter_number: int) -> str:
+        """读取章节上下文（在线程池中执行）"""
+        with self._memory_lock:
+            return self.memory.get_context(chapter_number)
+    
+    def _check_consistency(self, chapter: Dict[str, Any], chapter_number: int,
+                           outline: Dict[str, Any],
+                           characters: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """检查章节一致性（在线程池中执行）"""
+        with self._memory_lock:
+            previous_summaries = self.memory._get_recent_summaries(chapter_number, 3)
+        
+        return self.consistency_checker.check_chapter_consistency(
+            chapter, 
+            {
+                'outline': outline,
+                'characters': characters,
+                'previous_summaries': previous_summaries
+            }
+        )
+    
+    def _apply_memory_update(self, chapter_result: Any):
+        """
+        把生成成功的章节写入记忆
+        
+        Args:
+            chapter_result: 章节生成结果（取出其中的pending_memory）
+        """
+        if not isinstance(chapter_result, dict):
+            return
+        chapter = chapter_result.pop('pending_memory', None)
+        if chapter is None:
+            return
+        
+        try:
+            with self._memory_lock:
+                self.memory.update_with_chapter(chapter_result['chapter_number'], chapter)
+        except Exception as e:
+            logger.warning("⚠️ 第%s章记忆更新失败: %s", chapter_result['chapter_number'], e)
+    
+    def _save_chapter_files(self, chapter_results: List[Dict[str, Any]]):
+        """
+        把一批章节文件合并为一个IO任务写盘
+        
+        Args:
+            chapter_results: 章节生成结果（写盘后更新file_saved）
+            
+        Returns:
+            IO线程池中的Future
+        """
+        pending = [
+            (result, result.pop('pending_file', None))
+            for result in chapter_results
+            if isinstance(result, dict)
+        ]
+        
+        def write_all():
+            for result, pending_file in pending:
+                if pending_file:
+                    result['file_saved'] = write_file(*pending_file)
+        
+        return get_io_executor().submit(write_all)
+    
+    def _save_batch_results(self, results: Dict[str, Any], async_mode: bool = False):
+        """
+        保存批量生成结果
+        
+        Args:
+            results: 批量生成结果
+            async_mode: 为True时在IO线程池中写盘并立即返回
+        """
+        if async_mode:
+            # 复制一份快照，调用方之后修改results不影响写盘
+            snapshot = dict(results, chapters=list(results.get('chapters', [])))
+            return get_io_executor().submit(self._write_batch_results, snapshot)
+        return self._write_batch_results(results)
+    
+    def _write_batch_results(self, results: Dict[str, Any]):
+        """将批量生成结果写入日志目录"""
         try:
-            import json
             timestamp = time.strftime("%Y%m%d_%H%M%S")
             results_file = f"./outputs/logs/batch_results_{timestamp}.json"
             
             # 确保目录存在
-            import os
-            os.makedirs("./outputs/logs", exist_ok=True)
+            ensure_directories("./outputs/logs")
             
-            with open(results_file, 'w', encoding='utf-8') as f:
-                json.dump(results, f, ensure_ascii=False, indent=2)
+            # 安装了orjson时使用C实现序列化
+            with open(results_file, 'wb') as f:
+                f.write(dumps_json(results, indent=2))
             
-            print(f"✅ 批量生成结果已保存到: {results_file}")
+            logger.info("✅ 批量生成结果已保存到: %s", results_file)
             
         except Exception as e:
-            print(f"⚠️ 保存批量结果失败: {str(e)}")
+            logger.warning("⚠️ 保存批量结果失败: %s", e)
     
-    def generate_batch_with_plan(self, chapter_plan: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def generate_batch_with_plan(self, chapter_plan: List[Dict[str, Any]],
+                                 outline: Dict[str, Any] = None,
+                                 characters: List[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         根据章节计划批量生成
         
         Args:
             chapter_plan: 章节计划列表
+            outline: 小说大纲（默认从session_state读取）
+            characters: 人物列表（默认从session_state读取）
             
         Returns:
             生成结果
@@ -245,41 +429,53 @@ class BatchChapterGenerator:
         
         return self.generate_batch_chapters(
             start_chapter=start_chapter,
-            chapters_count=chapters_count
+            chapters_count=chapters_count,
+            outline=outline,
+            characters=characters
         )
     
-    async def async_generate_batch(self, chapters_info: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    async def async_generate_batch(self, chapters_info: List[Dict[str, Any]],
+                                   outline: Dict[str, Any] = None,
+                                   characters: List[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """
         异步批量生成章节（可选）
         
         Args:
-            chapters_info: 章节信息列表
+            chapters_info: 章节信息列表（number、可选target_words）
+            outline: 小说大纲（默认从session_state读取）
+            characters: 人物列表（默认从session_state读取）
             
         Returns:
             生成的章节列表
         """
-        async def generate_chapter_async(chapter_info: Dict[str, Any]):
-            try:
-                # 模拟异步生成
-                await asyncio.sleep(1)  # 模拟网络延迟
-                
-                # 这里可以调用真正的异步生成逻辑
-                return {
-                    "success": True,
-                    "chapter_number": chapter_info.get('number'),
-                    "title": f"第{chapter_info.get('number')}章"
-                }
-            except Exception as e:
-                return {
-                    "success": False,
-                    "chapter_number": chapter_info.get('number'),
-                    "error": str(e)
-                }
+        if outline is None:
+            outline = st.session_state.get('generated_outline', {})
+        if characters is None:
+            characters = st.session_state.get('characters', [])
         
-        # 并发执行所有章节生成任务
-        tasks = [generate_chapter_async(info) for info in chapters_info]
+        # LLM连接池绑定在共享事件循环上，章节任务提交到该循环执行，
+        # 调用方可以在任意事件循环中等待结果
+        tasks = [
+            asyncio.wrap_future(submit_async(self._generate_with_limit(
+                info.get('number'), info.get('target_words', 3000), outline, characters
+            )))
+            for info in chapters_info
+        ]
         results = await asyncio.gather(*tasks, return_exceptions=True)
         
+        # 记忆按章节顺序在线程池中更新
+        ordered = sorted(
+            (result for result in results if isinstance(result, dict)),
+            key=lambda result: result['chapter_number']
+        )
+        await asyncio.wrap_future(get_io_executor().submit(
+            lambda: [self._apply_memory_update(result) for result in ordered]
+        ))
+        
+        await asyncio.wrap_future(self._save_chapter_files(results))
+        
+        self._adjust_concurrency()
+        
         return results
 
 # 测试函数
@@ -288,7 +484,8 @@ if __name__ == "__main__":
     
     # 创建模拟组件
     class MockGenerator:
-        def generate_chapter(self, **kwargs):
+        async def generate_chapter_async(self, **kwargs):
+            await asyncio.sleep(0.1)  # 模拟网络延迟
             return {
                 "title": f"第{kwargs.get('chapter_number')}章",
                 "content": "测试内容" * 100,
@@ -310,7 +507,9 @@ if __name__ == "__main__":
         results = batch_gen.generate_batch_chapters(
             start_chapter=1,
             chapters_count=3,
-            words_per_chapter=1000
+            words_per_chapter=1000,
+            outline={"title": "测试小说"},
+            characters=[{"name": "主角"}]
         )
         
         print(f"批量生成结果: {results['success_count']}成功, {results['failed_count']}失败")
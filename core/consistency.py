@@ -3,13 +3,127 @@
 多维度验证小说内容的一致性
 """
 
+import hashlib
 import json
-from typing import Dict, List, Any, Tuple
+import re
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, List, Any, Set, Tuple
 from difflib import SequenceMatcher
 
+# 中文词语（两个汉字以上）
+_CJK_WORD_RE = re.compile(r'[\u4e00-\u9fa5]{2,}')
+
+# 常见停用词
+_STOPWORDS = frozenset({
+    '的', '了', '在', '是', '我', '有', '和', '就', '不', '人', '都', '一', '一个',
+    '上', '也', '很', '到', '说', '要', '去', '你', '会', '着', '没有', '看', '好', '自己', '这'
+})
+
+# 提取出的词语至少两个字，单字停用词不可能命中，过滤时只需检查多字停用词
+_WORD_STOPWORDS = frozenset(word for word in _STOPWORDS if len(word) >= 2)
+
+def _build_term_matcher(terms) -> Tuple[Any, Dict[str, Set[str]]]:
+    """
+    把多个人名/能力词编译成一个正则，每段正文只需扫描一遍
+    
+    Args:
+        terms: 待匹配的词语
+        
+    Returns:
+        (编译后的正则, 每个词包含的其他词的映射)，没有词语时正则为None
+    """
+    unique_terms = sorted({t for t in terms if isinstance(t, str) and t}, key=len, reverse=True)
+    if not unique_terms:
+        return None, {}
+    
+    # 零宽前瞻在每个位置都尝试匹配，长词优先；被长词包含的短词通过映射补齐
+    pattern = re.compile('(?=(' + '|'.join(map(re.escape, unique_terms)) + '))')
+    contained = {
+        term: {other for other in unique_terms if other != term and other in term}
+        for term in unique_terms
+    }
+    return pattern, contained
+
+def _find_terms(content: str, matcher: Tuple[Any, Dict[str, Set[str]]]) -> Set[str]:
+    """返回正文中出现过的所有词语"""
+    pattern, contained = matcher
+    if pattern is None or not content:
+        return set()
+    
+    found = set(pattern.findall(content))
+    for term in list(found):
+        found |= contained[term]
+    return found
+
+def _character_terms(characters: List[Dict[str, Any]]) -> List[str]:
+    """收集所有人物的名字和能力"""
+    terms = []
+    for character in characters:
+        terms.append(character.get('name', ''))
+        terms.extend(character.get('abilities', []) or [])
+    return terms
+
+# 时间指示词
+_TIME_INDICATORS = ('之前', '之后', '刚才', '现在', '未来', '过去')
+_TIME_INDICATOR_SET = frozenset(_TIME_INDICATORS)
+
+# 明显矛盾的词对
+_CONTRADICTIONS = (
+    ('死', '活'),
+    ('有', '无'),
+    ('存在', '不存在')
+)
+
+_LOGIC_MARKER_MATCHER = _build_term_matcher(
+    _TIME_INDICATORS + tuple(word for pair in _CONTRADICTIONS for word in pair)
+)
+
+# 逻辑问题的缓存：正文摘要 -> 问题列表。只以摘要为键，缓存不持有章节正文，
+# 命中时也不用逐字比较整章内容（缓存在所有会话间共享，读写时加锁）
+_LOGICAL_ISSUES_CACHE_SIZE = 4096
+_logical_issues_cache = OrderedDict()
+_logical_issues_lock = threading.Lock()
+
+def _logical_issues(content: str) -> Tuple[str, ...]:
+    """找出正文中的逻辑问题，结果按正文摘要缓存"""
+    digest = hashlib.blake2b(content.encode('utf-8'), digest_size=16).digest()
+    with _logical_issues_lock:
+        issues = _logical_issues_cache.get(digest)
+        if issues is not None:
+            _logical_issues_cache.move_to_end(digest)
+            return issues
+    
+    issues = _scan_logical_issues(content)
+    with _logical_issues_lock:
+        _logical_issues_cache[digest] = issues
+        if len(_logical_issues_cache) > _LOGICAL_ISSUES_CACHE_SIZE:
+            _logical_issues_cache.popitem(last=False)
+    return issues
+
+def _scan_logical_issues(content: str) -> Tuple[str, ...]:
+    """扫描一遍正文，找出所有时间指示词和矛盾词"""
+    issues = []
+    present = _find_terms(content, _LOGIC_MARKER_MATCHER)
+    
+    # 如果有多个时间指示词，可能存在时间矛盾
+    if len(present & _TIME_INDICATOR_SET) > 3:
+        issues.append("时间描述可能存在矛盾")
+    
+    for word1, word2 in _CONTRADICTIONS:
+        if word1 in present and word2 in present:
+            # 检查是否在同一上下文中
+            issues.append(f"可能存在'{word1}'和'{word2}'的矛盾")
+    
+    return tuple(issues)
+
 class ConsistencyChecker:
     """一致性检查器 - 极简实现"""
     
+    # 人物、情节、世界观、时间线的总体评分权重
+    COMPONENT_WEIGHTS = np.array([0.3, 0.4, 0.2, 0.1])
+    
     def __init__(self):
         self.character_profiles = {}
         self.worldview_rules = {}
@@ -17,7 +131,9 @@ class ConsistencyChecker:
     
     def check_character_consistency(self, character_name: str, 
                                    new_content: str, 
-                                   existing_profile: Dict[str, Any]) -> Dict[str, Any]:
+                                   existing_profile: Dict[str, Any],
+                                   content_keywords: Set[str] = None,
+                                   present_terms: Set[str] = None) -> Dict[str, Any]:
         """
         检查人物一致性
         
@@ -25,6 +141,8 @@ class ConsistencyChecker:
             character_name: 人物名称
             new_content: 新内容
             existing_profile: 已有的人物档案
+            content_keywords: 预先提取的新内容关键词（可选，缺省时重新提取）
+            present_terms: 预先扫描出的正文中出现的人名/能力（可选）
             
         Returns:
             检查结果
@@ -36,15 +154,25 @@ class ConsistencyChecker:
             "suggestions": []
         }
         
+        # 人物未出场时无需检查
+        if character_name:
+            if present_terms is not None:
+                if character_name not in present_terms:
+                    return results
+            elif character_name not in new_content:
+                return results
+        
         # 检查性格一致性
         personality = existing_profile.get('personality', '')
         if personality:
             # 简单检查：关键词匹配
             personality_keywords = self._extract_keywords(personality)
-            content_keywords = self._extract_keywords(new_content)
+            if content_keywords is None:
+                content_keywords = set(self._extract_keywords(new_content))
             
-            matching_keywords = [k for k in personality_keywords if k in content_keywords]
-            match_ratio = len(matching_keywords) / max(len(personality_keywords), 1)
+            # 按关键词出现次数计数（性格描述中重复的关键词每次都计入），与原先的逐个匹配一致
+            match_count = sum(keyword in content_keywords for keyword in personality_keywords)
+            match_ratio = match_count / max(len(personality_keywords), 1)
             
             if match_ratio < 0.3:
                 results["passed"] = False
@@ -56,10 +184,10 @@ class ConsistencyChecker:
         abilities = existing_profile.get('abilities', [])
         if abilities:
             # 检查新内容是否出现了未定义的能力
-            mentioned_abilities = []
-            for ability in abilities:
-                if ability in new_content:
-                    mentioned_abilities.append(ability)
+            if present_terms is not None:
+                mentioned_abilities = [ability for ability in abilities if ability in present_terms]
+            else:
+                mentioned_abilities = [ability for ability in abilities if ability in new_content]
             
             if len(mentioned_abilities) == 0 and len(abilities) > 0:
                 results["issues"].append(f"人物'{character_name}'的能力未在场景中体现")
@@ -67,13 +195,19 @@ class ConsistencyChecker:
         return results
     
     def check_plot_consistency(self, new_content: str, 
-                              previous_summaries: List[str]) -> Dict[str, Any]:
+                              previous_summaries: List[str],
+                              current_keywords: Set[str] = None,
+                              last_keywords: Set[str] = None,
+                              continuity_score: float = None) -> Dict[str, Any]:
         """
         检查情节一致性
         
         Args:
             new_content: 新内容
             previous_summaries: 之前章节的摘要
+            current_keywords: 预先提取的新内容关键词（可选）
+            last_keywords: 预先提取的上一章摘要关键词（可选）
+            continuity_score: 预先批量计算的连续性分数（可选）
             
         Returns:
             检查结果
@@ -90,10 +224,13 @@ class ConsistencyChecker:
             last_summary = previous_summaries[-1] if previous_summaries else ""
             
             # 简单检查：关键词连续性
-            last_keywords = self._extract_keywords(last_summary)
-            current_keywords = self._extract_keywords(new_content)
-            
-            continuity_score = self._calculate_continuity(last_keywords, current_keywords)
+            if continuity_score is None:
+                if last_keywords is None:
+                    last_keywords = set(self._extract_keywords(last_summary))
+                if current_keywords is None:
+                    current_keywords = set(self._extract_keywords(new_content))
+                
+                continuity_score = self._calculate_continuity(last_keywords, current_keywords)
             
             if continuity_score < 0.2:
                 results["score"] -= 20
@@ -180,82 +317,94 @@ class ConsistencyChecker:
             "timeline_consistency": {"score": 0, "issues": []}
         }
         
-        # 人物一致性检查
-        char_scores = []
+        # 每章正文和摘要的关键词只提取一次，供人物和情节检查复用
+        chapter_kw = {
+            num: set(self._extract_keywords(data.get('content', '')))
+            for num, data in chapters.items()
+        }
+        summary_kw = {
+            num: set(self._extract_keywords(data.get('summary', '')))
+            for num, data in chapters.items()
+        }
+        
+        # 所有人名和能力合成一个匹配器
+        matcher = _build_term_matcher(_character_terms(characters))
+        
+        # 人物一致性检查（评分写入预分配的数组）
+        char_scores = np.empty(len(characters) * len(chapters), dtype=np.int32)
+        char_count = 0
         char_issues = []
         
-        for character in characters:
-            char_name = character.get('name', '')
+        # 章节在外层：每章正文只取一次、只扫描一遍，再检查其中出现的人物
+        for chapter_num, chapter_data in chapters.items():
+            content = chapter_data.get('content', '')
+            present_terms = _find_terms(content, matcher)
+            content_keywords = chapter_kw[chapter_num]
             
-            # 检查该人物在所有章节中的表现
-            for chapter_num, chapter_data in chapters.items():
-                content = chapter_data.get('content', '')
+            for character in characters:
+                char_name = character.get('name', '')
                 
-                if char_name in content:
+                if not char_name or char_name in present_terms:
                     char_result = self.check_character_consistency(
-                        char_name, content, character
+                        char_name, content, character,
+                        content_keywords=content_keywords,
+                        present_terms=present_terms
                     )
                     
-                    char_scores.append(char_result['score'])
+                    char_scores[char_count] = char_result['score']
+                    char_count += 1
                     char_issues.extend(char_result['issues'])
         
-        if char_scores:
-            results["character_consistency"]["score"] = sum(char_scores) // len(char_scores)
+        if char_count:
+            results["character_consistency"]["score"] = int(char_scores[:char_count].mean())
             results["character_consistency"]["issues"] = char_issues[:5]  # 最多显示5个问题
         
         # 情节一致性检查
-        plot_scores = []
         plot_issues = []
         
         chapter_numbers = list(chapters.keys())
         chapter_numbers.sort()
+        plot_scores = np.empty(max(len(chapter_numbers) - 1, 0), dtype=np.int32)
+        
+        # 所有相邻章节对的连续性分数一次算出
+        continuity_scores = self._batch_continuity(
+            [summary_kw[num] for num in chapter_numbers[:-1]],
+            [chapter_kw[num] for num in chapter_numbers[1:]]
+        )
         
         for i in range(1, len(chapter_numbers)):
-            current_chapter = chapters[chapter_numbers[i]]
-            previous_chapter = chapters[chapter_numbers[i-1]]
+            current_num = chapter_numbers[i]
+            previous_num = chapter_numbers[i-1]
             
             plot_result = self.check_plot_consistency(
-                current_chapter.get('content', ''),
-                [previous_chapter.get('summary', '')]
+                chapters[current_num].get('content', ''),
+                [chapters[previous_num].get('summary', '')],
+                continuity_score=float(continuity_scores[i-1])
             )
             
-            plot_scores.append(plot_result['score'])
+            plot_scores[i-1] = plot_result['score']
             plot_issues.extend(plot_result['issues'])
         
-        if plot_scores:
-            results["plot_consistency"]["score"] = sum(plot_scores) // len(plot_scores)
+        if plot_scores.size:
+            results["plot_consistency"]["score"] = int(plot_scores.mean())
             results["plot_consistency"]["issues"] = plot_issues[:5]
         
-        # 计算总体评分
-        component_scores = [
+        # 计算总体评分（加权平均，一次向量点积）
+        component_scores = np.array([
             results["character_consistency"]["score"],
             results["plot_consistency"]["score"],
             results["worldview_consistency"]["score"],
             results["timeline_consistency"]["score"]
-        ]
+        ], dtype=np.float64)
         
-        # 加权平均
-        weights = [0.3, 0.4, 0.2, 0.1]
-        overall_score = sum(score * weight for score, weight in zip(component_scores, weights))
-        results["overall_score"] = int(overall_score)
+        results["overall_score"] = int(component_scores @ self.COMPONENT_WEIGHTS)
         
         return results
     
     def _extract_keywords(self, text: str, max_keywords: int = 10) -> List[str]:
         """提取关键词"""
-        # 简单实现：提取长度大于2的中文字符
-        import re
-        
-        # 提取中文词语
-        chinese_words = re.findall(r'[\u4e00-\u9fa5]{2,}', text)
-        
-        # 去除常见停用词
-        stopwords = {'的', '了', '在', '是', '我', '有', '和', '就', '不', '人', '都', '一', '一个', '上', '也', '很', '到', '说', '要', '去', '你', '会', '着', '没有', '看', '好', '自己', '这'}
-        
-        keywords = [word for word in chinese_words if word not in stopwords]
-        
-        # 返回前N个关键词
-        return keywords[:max_keywords]
+        # 简单实现：提取长度大于2的中文词语，去除停用词后返回前N个
+        return [word for word in _CJK_WORD_RE.findall(text) if word not in _WORD_STOPWORDS][:max_keywords]
     
     def _calculate_continuity(self, last_keywords: List[str], 
                              current_keywords: List[str]) -> float:
@@ -264,49 +413,54 @@ class ConsistencyChecker:
             return 0.0
         
         # 计算关键词重叠率
-        common_keywords = set(last_keywords) & set(current_keywords)
-        continuity = len(common_keywords) / max(len(set(last_keywords)), 1)
+        last_set = set(last_keywords)
+        common_keywords = last_set.intersection(current_keywords)
+        continuity = len(common_keywords) / max(len(last_set), 1)
         
         return continuity
     
+    def _batch_continuity(self, last_keyword_sets: List[Set[str]],
+                          current_keyword_sets: List[Set[str]]) -> np.ndarray:
+        """
+        批量计算多组关键词的连续性分数（与_calculate_continuity结果一致）
+        
+        Args:
+            last_keyword_sets: 每组的上一章关键词
+            current_keyword_sets: 每组的当前章节关键词
+            
+        Returns:
+            每组的连续性分数
+        """
+        if not last_keyword_sets:
+            return np.zeros(0)
+        
+        # 关键词映射到列下标，每组关键词编码成一行布尔向量
+        vocab = {word: idx for idx, word in enumerate(set().union(*last_keyword_sets, *current_keyword_sets))}
+        last_matrix = np.zeros((len(last_keyword_sets), len(vocab)), dtype=bool)
+        current_matrix = np.zeros((len(current_keyword_sets), len(vocab)), dtype=bool)
+        
+        for row, keywords in enumerate(last_keyword_sets):
+            last_matrix[row, [vocab[word] for word in keywords]] = True
+        for row, keywords in enumerate(current_keyword_sets):
+            current_matrix[row, [vocab[word] for word in keywords]] = True
+        
+        overlap = np.count_nonzero(last_matrix & current_matrix, axis=1)
+        return overlap / np.maximum(np.count_nonzero(last_matrix, axis=1), 1)
+    
     def _check_logical_issues(self, content: str) -> List[str]:
-        """检查逻辑漏洞"""
-        issues = []
-        
-        # 简单检查：时间矛盾
-        time_indicators = ['之前', '之后', '刚才', '现在', '未来', '过去']
-        time_mentions = []
-        
-        for indicator in time_indicators:
-            if indicator in content:
-                time_mentions.append(indicator)
-        
-        # 如果有多个时间指示词，可能存在时间矛盾
-        if len(time_mentions) > 3:
-            issues.append("时间描述可能存在矛盾")
-        
-        # 检查明显矛盾
-        contradictions = [
-            ('死', '活'),
-            ('有', '无'),
-            ('存在', '不存在')
-        ]
-        
-        for word1, word2 in contradictions:
-            if word1 in content and word2 in content:
-                # 检查是否在同一上下文中
-                issues.append(f"可能存在'{word1}'和'{word2}'的矛盾")
-        
-        return issues
+        """检查逻辑漏洞（相同正文只检查一次）"""
+        return list(_logical_issues(content))
     
     def check_chapter_consistency(self, chapter_data: Dict[str, Any], 
-                                 context: Dict[str, Any]) -> Dict[str, Any]:
+                                 context: Dict[str, Any],
+                                 min_score: int = None) -> Dict[str, Any]:
         """
         检查单个章节的一致性
         
         Args:
             chapter_data: 章节数据
             context: 上下文信息
+            min_score: 评分不高于该值时提前结束（可选，默认执行全部检查）
             
         Returns:
             检查结果
@@ -320,51 +474,52 @@ class ConsistencyChecker:
         }
         
         content = chapter_data.get('content', '')
+        content_keywords = set(self._extract_keywords(content))
         
-        # 1. 人物一致性检查
-        if 'characters' in context:
-            for character in context['characters']:
-                char_name = character.get('name', '')
-                if char_name in content:
-                    char_result = self.check_character_consistency(
-                        char_name, content, character
-                    )
-                    
-                    results['detailed_checks'][f'character_{char_name}'] = char_result
-                    
-                    if not char_result['passed']:
-                        results['passed'] = False
-                        results['score'] = min(results['score'], char_result['score'])
-                        results['issues'].extend(char_result['issues'])
-                        results['suggestions'].extend(char_result['suggestions'])
-        
-        # 2. 情节一致性检查
-        if 'previous_summaries' in context:
-            plot_result = self.check_plot_consistency(
-                content, context['previous_summaries']
-            )
+        def merge(check_name: str, check_result: Dict[str, Any]) -> bool:
+            """合并子检查结果，返回是否已低于阈值"""
+            results['detailed_checks'][check_name] = check_result
             
-            results['detailed_checks']['plot'] = plot_result
-            
-            if not plot_result['passed']:
+            if not check_result['passed']:
                 results['passed'] = False
-                results['score'] = min(results['score'], plot_result['score'])
-                results['issues'].extend(plot_result['issues'])
-                results['suggestions'].extend(plot_result['suggestions'])
+                results['score'] = min(results['score'], check_result['score'])
+                results['issues'].extend(check_result['issues'])
+                results['suggestions'].extend(check_result['suggestions'])
+            
+            return min_score is not None and results['score'] <= min_score
         
-        # 3. 世界观一致性检查
+        # 按开销从小到大检查，低于阈值时不再执行后面的检查
+        # 1. 世界观一致性检查
         if 'worldview' in context:
             worldview_result = self.check_worldview_consistency(
                 content, context['worldview']
             )
+            if merge('worldview', worldview_result):
+                return results
+        
+        # 2. 情节一致性检查
+        if 'previous_summaries' in context:
+            plot_result = self.check_plot_consistency(
+                content, context['previous_summaries'],
+                current_keywords=content_keywords
+            )
+            if merge('plot', plot_result):
+                return results
+        
+        # 3. 人物一致性检查
+        if 'characters' in context:
+            present_terms = _find_terms(content, _build_term_matcher(_character_terms(context['characters'])))
             
-            results['detailed_checks']['worldview'] = worldview_result
-            
-            if not worldview_result['passed']:
-                results['passed'] = False
-                results['score'] = min(results['score'], worldview_result['score'])
-                results['issues'].extend(worldview_result['issues'])
-                results['suggestions'].extend(worldview_result['suggestions'])
+            for character in context['characters']:
+                char_name = character.get('name', '')
+                if not char_name or char_name in present_terms:
+                    char_result = self.check_character_consistency(
+                        char_name, content, character,
+                        content_keywords=content_keywords,
+                        present_terms=present_terms
+                    )
+                    if merge(f'character_{char_name}', char_result):
+                        return results
         
         return results
 
@@ -3,16 +3,33 @@
 极简实现，专注于一致性
 """
 
+import asyncio
+import hashlib
 import json
+import logging
 import os
-from typing import Dict, List, Any, Optional
-from langchain.chains import LLMChain
-from langchain.prompts import PromptTemplate
+import random
+import re
+from typing import Dict, List, Any, AsyncIterator, Callable, Iterable, Optional, Tuple
+from langchain.prompts import ChatPromptTemplate
 from langchain_community.chat_models import ChatOpenAI
 from langchain.schema import BaseOutputParser
-import yaml
+# 容错解析被截断的JSON（langchain-core自带），缺失时使用本模块的简易补全
+try:
+    from langchain_core.utils.json import parse_partial_json
+except ImportError:
+    parse_partial_json = None
 import functools
 import time
+from .async_client import create_async_openai, run_async
+# Support importing when module is executed as part of the package (relative import)
+# and when executed directly as a script (absolute import).
+try:
+    from ..utils.file_utils import dumps_json, loads_json, load_yaml, load_json, save_json
+except Exception:
+    from utils.file_utils import dumps_json, loads_json, load_yaml, load_json, save_json
+
+logger = logging.getLogger(__name__)
 
 def retry_on_timeout(max_retries=3, delay=2):
     """超时重试装饰器"""
@@ -35,21 +52,256 @@ def retry_on_timeout(max_retries=3, delay=2):
         return wrapper
     return decorator
 
+@functools.lru_cache(maxsize=1)
+def _load_config(path: str = 'config.yaml') -> Dict[str, Any]:
+    """读取配置文件（使用C加速的YAML解析器，结果缓存），读取失败时使用默认配置"""
+    config = load_yaml(path)
+    if not isinstance(config, dict) or 'deepseek' not in config:
+        # 使用默认配置
+        config = {
+            'deepseek': {
+                'model': 'deepseek-chat',
+                'max_tokens': 4000,
+                'temperature': 0.7
+            }
+        }
+    return config
+
+def _prompt_json(data: Any) -> str:
+    """把大纲、人物等序列化为紧凑JSON填入提示词（安装了orjson时使用C实现）"""
+    return dumps_json(data, indent=None).decode('utf-8')
+
+# 输出格式示例在导入时序列化一次为紧凑JSON，作为模板的partial变量填入，无需转义花括号
+_OUTLINE_SCHEMA = _prompt_json({
+    "title": "小说标题",
+    "theme": "核心主题",
+    "summary": "300-500字故事梗概",
+    "target_words": "目标字数(整数，与要求的目标字数一致)",
+    "estimated_chapters": "估算章节数(整数)",
+    "volumes": [{
+        "volume_number": 1,
+        "volume_name": "卷名",
+        "description": "卷描述",
+        "difficulty": "简单/中等/困难",
+        "estimated_chapters": "预计章节数(整数)",
+        "key_events": ["关键事件"]
+    }],
+    "key_plot_points": ["关键情节点"]
+})
+
+_CHARACTER_SCHEMA = _prompt_json([{
+    "name": "姓名",
+    "age": "年龄",
+    "gender": "性别",
+    "appearance": "外貌特征",
+    "identity": "身份背景（与故事的关系）",
+    "personality": "性格特点",
+    "motivation": "核心动机",
+    "growth_arc": "成长弧线",
+    "abilities": ["特殊能力"],
+    "relationship_to_story": "与故事的关系"
+}])
+
+_CHAPTER_SCHEMA = _prompt_json({
+    "title": "章节标题",
+    "content": "章节内容",
+    "summary": "本章摘要（100-200字）",
+    "word_count": "实际字数(整数)",
+    "key_events": ["本章关键事件"],
+    "character_development": {"人物名": "发展描述"}
+})
+
+_WORLDVIEW_SCHEMA = _prompt_json({
+    "basic_setting": "基本设定",
+    "power_system": "力量体系",
+    "social_structure": "社会结构",
+    "culture": "文化风俗",
+    "special_rules": "特殊规则",
+    "history": "历史背景"
+})
+
+# 提示词只保留必要指令，减少每次请求的token数
+_OUTLINE_SYSTEM_PROMPT = (
+    "你是专业小说创作助手。根据用户的创意和要求生成详细大纲：分3卷（难度递进），5个关键情节点。"
+    "只输出JSON，格式：{output_schema}"
+)
+
+_CHARACTER_SYSTEM_PROMPT = (
+    "你是专业小说创作助手。根据用户给出的大纲生成与故事紧密相关的主要角色和重要配角。"
+    "只输出JSON数组，格式：{output_schema}"
+)
+
+_CHAPTER_SYSTEM_PROMPT = (
+    "你是专业小说创作助手。根据用户给出的大纲、人物和上下文写一章小说："
+    "保持人物一致性，推进情节，符合整体风格，埋下伏笔，字数接近目标。"
+    "只输出JSON，格式：{output_schema}"
+)
+
+_WORLDVIEW_SYSTEM_PROMPT = (
+    "你是专业小说创作助手。根据用户给出的大纲和人物构建世界观：基本设定（时代、地域、文明）、"
+    "力量体系（如有）、社会结构、文化风俗、特殊规则、历史背景。"
+    "只输出JSON，格式：{output_schema}"
+)
+
+# LangChain消息类型到OpenAI接口角色的映射
+_MESSAGE_ROLES = {"system": "system", "human": "user", "ai": "assistant"}
+
+# 章节结果必须包含的字段及缺失时的默认值
+CHAPTER_EXPECTED_KEYS = {
+    "title": "",
+    "content": "",
+    "summary": "",
+    "key_events": [],
+    "character_development": {}
+}
+
+# 代码块围栏（允许缺少结尾围栏，兼容被截断的输出）
+_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)(?:```|$)", re.S)
+
+# 对象或数组末尾多余的逗号
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+
+def _close_truncated_json(text: str) -> str:
+    """
+    补全被截断的JSON：闭合未结束的字符串，再按嵌套顺序补上缺失的括号
+    
+    Args:
+        text: 可能被截断的JSON文本
+        
+    Returns:
+        补全后的文本（不保证一定合法，例如截断在键名之后）
+    """
+    closers = []
+    in_string = False
+    escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            closers.append("}")
+        elif char == "[":
+            closers.append("]")
+        elif char in "}]" and closers:
+            closers.pop()
+    
+    if in_string:
+        if escaped:
+            text = text[:-1]
+        text += '"'
+    text = text.rstrip().rstrip(",")
+    return text + "".join(reversed(closers))
+
 class JSONOutputParser(BaseOutputParser):
-    """JSON输出解析器"""
+    """JSON输出解析器（容错：代码块、多余逗号、输出被截断）"""
     
     def parse(self, text: str) -> Dict[str, Any]:
-        try:
-            # 清理JSON格式
-            if "```json" in text:
-                text = text.split("```json")[1].split("```")[0].strip()
-            elif "```" in text:
-                text = text.split("```")[1].split("```")[0].strip()
+        # 清理JSON格式
+        text = self._strip_fence(text)
+        
+        result, truncated = self._loads_with_completion(text)
+        if result is None:
+            # 如果解析失败，返回包含原始文本的简单结构
+            return {"content": text, "error": "JSON解析失败"}
+        if truncated and isinstance(result, dict):
+            # 输出达到max_tokens被截断：保留已生成的字段，由调用方决定是否续写
+            result["truncated"] = True
+        return result
+    
+    @staticmethod
+    def _strip_fence(text: str) -> str:
+        """去掉markdown代码块围栏（没有围栏时不运行正则）"""
+        if "```" in text:
+            match = _FENCE_RE.search(text)
+            if match:
+                text = match.group(1)
+        return text.strip()
+    
+    @staticmethod
+    def _loads_lenient(text: str) -> Any:
+        """依次尝试严格解析、去掉多余逗号、补全被截断的JSON，失败返回None"""
+        return JSONOutputParser._loads_with_completion(text)[0]
+    
+    @staticmethod
+    def _loads_with_completion(text: str) -> Tuple[Any, bool]:
+        """
+        容错解析JSON
+        
+        Args:
+            text: 去掉围栏后的模型输出
             
-            return json.loads(text)
+        Returns:
+            (解析结果, 是否经过截断补全)，无法解析时结果为None
+        """
+        try:
+            return loads_json(text), False
         except json.JSONDecodeError:
-            # 如果解析失败，返回包含原始文本的简单结构
-            return {"content": text.strip(), "error": "JSON解析失败"}
+            pass
+        
+        text = _TRAILING_COMMA_RE.sub(r"\1", text)
+        try:
+            return loads_json(text), False
+        except json.JSONDecodeError:
+            pass
+        
+        # 完整的输出中字符串值可能含有未转义的换行（多段落正文），这不算截断
+        try:
+            return json.loads(text, strict=False), False
+        except json.JSONDecodeError:
+            pass
+        
+        # 到这里只有补全缺失的引号、括号后才能解析，说明输出被截断；
+        # 模型输出的不是JSON（例如一段说明文字）时补全后依然解析失败，返回None
+        try:
+            if parse_partial_json is not None:
+                result = parse_partial_json(text)
+            else:
+                result = json.loads(_close_truncated_json(text), strict=False)
+        except json.JSONDecodeError:
+            result = None
+        return result, result is not None
+    
+    async def parse_stream(self, chunks: AsyncIterator[str], min_chars: int = 64) -> AsyncIterator[Any]:
+        """
+        流式解析：累积的文本每增长min_chars个字符尝试解析一次，结束时再解析一次
+        
+        Args:
+            chunks: 模型输出的文本片段
+            min_chars: 两次解析之间至少新增的字符数（避免每个token都重新解析全文）
+            
+        Yields:
+            目前为止能解析出的部分结果（内容有变化时才产出）
+        """
+        parts = []
+        size = 0
+        parsed_size = 0
+        last = None
+        
+        def parse_buffer():
+            return self._loads_lenient(self._strip_fence("".join(parts)))
+        
+        async for chunk in chunks:
+            parts.append(chunk)
+            size += len(chunk)
+            if size - parsed_size < min_chars:
+                continue
+            
+            parsed_size = size
+            partial = parse_buffer()
+            if partial is not None and partial != last:
+                last = partial
+                yield partial
+        
+        if size != parsed_size or last is None:
+            partial = parse_buffer()
+            if partial is not None and partial != last:
+                yield partial
 
 class NovelGenerator:
     """极简小说生成器 - 专注于一致性"""
@@ -65,6 +317,9 @@ class NovelGenerator:
             raise ValueError("API密钥不能为空")
         
         try:
+            # 异步请求走全应用共享的连接池
+            self._raw_client = create_async_openai(api_key)
+            
             self.llm = ChatOpenAI(
                 model="deepseek-chat",
                 openai_api_key=api_key,
@@ -73,207 +328,126 @@ class NovelGenerator:
                 max_tokens=2000,  # 减少生成的token数
                 timeout=120,      # 增加超时时间到120秒
                 max_retries=2,    # 添加重试机制
-                request_timeout=120  # 请求超时时间
+                request_timeout=120,  # 请求超时时间
+                async_client=self._raw_client.chat.completions
             )
             
             self.output_parser = JSONOutputParser()
             
-            # 加载配置
-            try:
-                with open('config.yaml', 'r', encoding='utf-8') as f:
-                    self.config = yaml.safe_load(f)
-            except:
-                # 使用默认配置
-                self.config = {
-                    'deepseek': {
-                        'model': 'deepseek-chat',
-                        'max_tokens': 4000,
-                        'temperature': 0.7
-                    }
-                }
+            # 加载配置（进程内只解析一次）
+            self.config = _load_config()
             
             # 初始化提示词模板
             self._init_templates()
             
-            print(f"✅ 生成器初始化成功 (模型: {self.config['deepseek'].get('model', 'deepseek-chat')})")
+            logger.info("✅ 生成器初始化成功 (模型: %s)", self.config['deepseek'].get('model', 'deepseek-chat'))
             
         except Exception as e:
-            print(f"❌ 生成器初始化失败: {str(e)}")
+            logger.error("❌ 生成器初始化失败: %s", e)
             raise ValueError(f"生成器初始化失败: {str(e)}")
     
     def _init_templates(self):
-        """初始化提示词模板"""
-        
-        # 大纲生成模板
-        # 将原来的三幕结构改为副本/卷结构
-        self.outline_template = PromptTemplate(
-            input_variables=["creative", "word_count", "novel_type", "writing_style"],
-            template="""
-            你是一个专业的小说创作助手。请基于以下创意生成一个详细的小说大纲：
-            
-            ## 创意灵感：
-            {creative}
-            
-            ## 创作要求：
-            小说类型：{novel_type}
-            目标字数：{word_count}字
-            写作风格：{writing_style}
-            
-            ## 输出要求（严格JSON格式）：
-            {{
-                "title": "小说标题",
-                "theme": "核心主题",
-                "summary": "300-500字的故事梗概",
-                "target_words": {word_count},
-                "estimated_chapters": 基于字数估算的章节数,
-                "volumes": [
-                    {{
-                        "volume_number": 1,
-                        "volume_name": "第一卷名",
-                        "description": "第一卷描述",
-                        "difficulty": "简单/中等/困难",
-                        "estimated_chapters": 预计章节数,
-                        "key_events": ["关键事件1", "关键事件2"]
-                    }},
-                    {{
-                        "volume_number": 2,
-                        "volume_name": "第二卷名",
-                        "description": "第二卷描述",
-                        "difficulty": "中等",
-                        "estimated_chapters": 预计章节数,
-                        "key_events": ["关键事件1", "关键事件2"]
-                    }},
-                    {{
-                        "volume_number": 3,
-                        "volume_name": "第三卷名",
-                        "description": "第三卷描述",
-                        "difficulty": "困难",
-                        "estimated_chapters": 预计章节数,
-                        "key_events": ["关键事件1", "关键事件2"]
-                    }}
-                ],
-                "key_plot_points": [
-                    "关键情节点1",
-                    "关键情节点2",
-                    "关键情节点3",
-                    "关键情节点4",
-                    "关键情节点5"
-                ]
-            }}
-            
-            请确保输出是纯JSON格式，不要有任何其他文本。
-            """
-        )
+        """
+        初始化提示词模板
         
-        # 人物生成模板
-        # 修改人物生成模板，强调基于大纲生成
-        self.character_template = PromptTemplate(
-            input_variables=["outline"],
-            template="""
-            基于以下小说大纲，生成相关的人物设定：
-            
-            小说大纲：
-            {outline}
-            
-            要求：
-            1. 基于上述大纲内容，生成与故事相关的人物
-            2. 包括主要角色和重要配角
-            3. 每个人物包含：
-            - 姓名、年龄、性别、外貌特征
-            - 身份背景（与故事的关系）
-            - 性格特点
-            - 核心动机和目标
-            - 成长弧线
-            - 特殊能力（如果有）
-            
-            请确保生成的人物与大纲内容紧密相关。
-            
-            输出格式（JSON数组）：
-            [
-                {{
-                    "name": "姓名",
-                    "age": "年龄",
-                    "gender": "性别",
-                    "appearance": "外貌特征",
-                    "identity": "身份背景（说明与故事的关系）",
-                    "personality": "性格特点",
-                    "motivation": "核心动机",
-                    "growth_arc": "成长弧线",
-                    "abilities": ["能力1", "能力2"],
-                    "relationship_to_story": "与故事的关系描述"
-                }}
-            ]
-            """
-        )
+        固定的角色说明、要求和输出格式放在system消息里，大纲、人物等变量放在
+        最后的user消息里，使每次请求的前缀保持一致，命中服务端的前缀缓存。
+        """
+        
+        # 大纲生成模板（副本/卷结构）
+        self.outline_template = ChatPromptTemplate.from_messages([
+            ("system", _OUTLINE_SYSTEM_PROMPT),
+            ("user", "创意：{creative}\n类型：{novel_type}\n目标字数：{word_count}字\n风格：{writing_style}")
+        ]).partial(output_schema=_OUTLINE_SCHEMA)
+        
+        # 人物生成模板（强调基于大纲生成）
+        self.character_template = ChatPromptTemplate.from_messages([
+            ("system", _CHARACTER_SYSTEM_PROMPT),
+            ("user", "大纲：{outline}")
+        ]).partial(output_schema=_CHARACTER_SCHEMA)
         
         # 章节生成模板
-        self.chapter_template = PromptTemplate(
-            input_variables=["chapter_number", "outline", "characters", "context", "target_words"],
-            template="""
-            基于以下信息，生成小说章节：
-            
-            章节编号：{chapter_number}
-            目标字数：{target_words}字
-            
-            ## 小说大纲：
-            {outline}
-            
-            ## 主要人物：
-            {characters}
-            
-            ## 相关上下文：
-            {context}
-            
-            要求：
-            1. 保持人物性格和行为一致性
-            2. 推进情节发展
-            3. 符合故事整体风格
-            4. 埋下后续情节的伏笔
-            5. 控制字数在目标范围内
-            
-            输出格式：
-            {{
-                "title": "章节标题",
-                "content": "章节内容",
-                "summary": "本章摘要（100-200字）",
-                "word_count": 实际字数,
-                "key_events": ["本章关键事件1", "本章关键事件2"],
-                "character_development": {{
-                    "人物1": "发展描述",
-                    "人物2": "发展描述"
-                }}
-            }}
-            """
-        )
+        # 大纲在同一次批量生成中不变，紧跟在system消息之后，也能被缓存
+        self.chapter_template = ChatPromptTemplate.from_messages([
+            ("system", _CHAPTER_SYSTEM_PROMPT),
+            ("user", "大纲：{outline}"),
+            ("user", "人物：{characters}\n上下文：{context}\n章节编号：{chapter_number}\n目标字数：{target_words}字")
+        ]).partial(output_schema=_CHAPTER_SCHEMA)
+        
+        # 批量生成的章节模板：大纲和完整人物表整批只发送一次作为固定前缀，
+        # 每章的消息只带出场人物名、上下文和章节编号
+        self.batch_chapter_template = ChatPromptTemplate.from_messages([
+            ("system", _CHAPTER_SYSTEM_PROMPT),
+            ("user", "大纲：{outline}\n人物表：{roster}"),
+            ("user", "本章出场人物：{characters}\n上下文：{context}\n章节编号：{chapter_number}\n目标字数：{target_words}字")
+        ]).partial(output_schema=_CHAPTER_SCHEMA)
         
         # 世界观生成模板
-        self.worldview_template = PromptTemplate(
-            input_variables=["outline", "characters"],
-            template="""
-            基于以下小说大纲和人物，构建详细的世界观设定：
-            
-            大纲：{outline}
-            人物：{characters}
-            
-            包括：
-            1. 世界基本设定（时代、地域、文明等）
-            2. 力量体系（如果有）
-            3. 社会结构
-            4. 文化风俗
-            5. 特殊规则
-            6. 历史背景
+        self.worldview_template = ChatPromptTemplate.from_messages([
+            ("system", _WORLDVIEW_SYSTEM_PROMPT),
+            ("user", "大纲：{outline}\n人物：{characters}")
+        ]).partial(output_schema=_WORLDVIEW_SCHEMA)
+        
+        # 提示词、模型和解析器组合成的调用链只构建一次，每次生成直接复用
+        self._outline_chain = self.outline_template | self.llm | self.output_parser
+        self._character_chain = self.character_template | self.llm | self.output_parser
+        self._chapter_chain = self.chapter_template | self.llm | self.output_parser
+        self._worldview_chain = self.worldview_template | self.llm | self.output_parser
+    
+    def _cache_path(self, name: str, inputs: Dict[str, Any]) -> Optional[str]:
+        """
+        响应缓存文件路径（按模板名、模型和输入计算哈希）
+        
+        Args:
+            name: 模板名称
+            inputs: 模板输入
             
-            输出格式：
-            {{
-                "basic_setting": "基本设定",
-                "power_system": "力量体系",
-                "social_structure": "社会结构",
-                "culture": "文化风俗",
-                "special_rules": "特殊规则",
-                "history": "历史背景"
-            }}
-            """
-        )
+        Returns:
+            缓存文件路径，未启用缓存时返回None
+        """
+        cache_config = self.config.get('cache') or {}
+        if not cache_config.get('enabled'):
+            return None
+        
+        model = self.config['deepseek'].get('model', 'deepseek-chat')
+        payload = json.dumps([name, model, inputs], sort_keys=True, ensure_ascii=False, default=str)
+        key = hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+        return os.path.join(cache_config.get('path', './cache/llm'), f"{name}_{key}.json")
+    
+    @staticmethod
+    def _is_cacheable(result: Any) -> bool:
+        """只缓存解析成功的结果"""
+        return isinstance(result, list) or (isinstance(result, dict) and 'error' not in result)
+    
+    def _invoke_cached(self, name: str, chain: Any, inputs: Dict[str, Any]) -> Any:
+        """调用模型，启用缓存时相同输入直接返回上次的结果"""
+        cache_path = self._cache_path(name, inputs)
+        if cache_path:
+            cached = load_json(cache_path)
+            if cached is not None:
+                return cached['result']
+        
+        result = chain.invoke(inputs)
+        
+        if cache_path and self._is_cacheable(result):
+            save_json({"result": result}, cache_path)
+        return result
+    
+    async def _ainvoke_cached(self, name: str, chain: Any, inputs: Dict[str, Any]) -> Any:
+        """_invoke_cached的异步版本（缓存文件在线程池中读写）"""
+        cache_path = self._cache_path(name, inputs)
+        loop = asyncio.get_running_loop()
+        if cache_path:
+            cached = await loop.run_in_executor(None, load_json, cache_path)
+            if cached is not None:
+                return cached['result']
+        
+        result = await chain.ainvoke(inputs)
+        
+        if cache_path and self._is_cacheable(result):
+            await loop.run_in_executor(None, save_json, {"result": result}, cache_path)
+        return result
+    
     @retry_on_timeout(max_retries=2, delay=1)
     def generate_outline(self, creative: str, word_count: int, novel_type: str, writing_style: str) -> Dict[str, Any]:
         """
@@ -288,21 +462,35 @@ class NovelGenerator:
         Returns:
             大纲字典
         """
-        chain = LLMChain(
-            llm=self.llm,
-            prompt=self.outline_template,
-            output_parser=self.output_parser
-        )
-        
-        result = chain.run(
-            creative=creative,
-            word_count=word_count,
-            novel_type=novel_type,
-            writing_style=writing_style
-        )
+        result = self._invoke_cached("outline", self._outline_chain, {
+            "creative": creative,
+            "word_count": word_count,
+            "novel_type": novel_type,
+            "writing_style": writing_style
+        })
         
         return result
     
+    async def generate_outline_async(self, creative: str, word_count: int, novel_type: str, writing_style: str) -> Dict[str, Any]:
+        """
+        异步生成小说大纲
+        
+        Args:
+            creative: 创意描述
+            word_count: 目标字数
+            novel_type: 小说类型
+            writing_style: 写作风格
+            
+        Returns:
+            大纲字典
+        """
+        return await self._ainvoke_cached("outline", self._outline_chain, {
+            "creative": creative,
+            "word_count": word_count,
+            "novel_type": novel_type,
+            "writing_style": writing_style
+        })
+    
     def generate_characters(self, outline: Dict[str, Any]) -> List[Dict[str, Any]]:
         """
         生成人物设定
@@ -313,14 +501,26 @@ class NovelGenerator:
         Returns:
             人物列表
         """
-        chain = LLMChain(
-            llm=self.llm,
-            prompt=self.character_template,
-            output_parser=self.output_parser
-        )
+        result = self._invoke_cached("characters", self._character_chain, {"outline": _prompt_json(outline)})
         
-        result = chain.run(outline=json.dumps(outline, ensure_ascii=False))
+        return self._normalize_characters_result(result)
+    
+    async def generate_characters_async(self, outline: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        异步生成人物设定，可与其他框架生成步骤并发执行
         
+        Args:
+            outline: 小说大纲
+            
+        Returns:
+            人物列表
+        """
+        result = await self._ainvoke_cached("characters", self._character_chain, {"outline": _prompt_json(outline)})
+        
+        return self._normalize_characters_result(result)
+    
+    def _normalize_characters_result(self, result: Any) -> List[Dict[str, Any]]:
+        """将解析结果统一为人物列表"""
         if isinstance(result, list):
             return result
         elif isinstance(result, dict) and 'characters' in result:
@@ -352,22 +552,65 @@ class NovelGenerator:
         Returns:
             世界观字典
         """
-        chain = LLMChain(
-            llm=self.llm,
-            prompt=self.worldview_template,
-            output_parser=self.output_parser
-        )
+        result = self._invoke_cached("worldview", self._worldview_chain, {
+            "outline": _prompt_json(outline),
+            "characters": _prompt_json(characters)
+        })
         
-        result = chain.run(
-            outline=json.dumps(outline, ensure_ascii=False),
-            characters=json.dumps(characters, ensure_ascii=False)
-        )
+        return result if isinstance(result, dict) else {}
+    
+    async def generate_worldview_async(self, outline: Dict[str, Any], characters: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        异步生成世界观设定
+        
+        Args:
+            outline: 小说大纲
+            characters: 人物列表（可为空，此时只根据大纲生成）
+            
+        Returns:
+            世界观字典
+        """
+        result = await self._ainvoke_cached("worldview", self._worldview_chain, {
+            "outline": _prompt_json(outline),
+            "characters": _prompt_json(characters)
+        })
         
         return result if isinstance(result, dict) else {}
     
+    async def setup_async(self, creative: str, word_count: int, novel_type: str, writing_style: str,
+                          eager: bool = True) -> Dict[str, Any]:
+        """
+        生成小说框架：先生成大纲，再生成人物和世界观
+        
+        Args:
+            creative: 创意描述
+            word_count: 目标字数
+            novel_type: 小说类型
+            writing_style: 写作风格
+            eager: 为True时人物和世界观并发生成（世界观只参考大纲）；
+                为False时等人物生成完再生成世界观
+            
+        Returns:
+            包含outline、characters、worldview的字典
+        """
+        outline = await self.generate_outline_async(creative, word_count, novel_type, writing_style)
+        
+        if eager:
+            characters, worldview = await asyncio.gather(
+                self.generate_characters_async(outline),
+                self.generate_worldview_async(outline, [])
+            )
+        else:
+            characters = await self.generate_characters_async(outline)
+            worldview = await self.generate_worldview_async(outline, characters)
+        
+        return {"outline": outline, "characters": characters, "worldview": worldview}
+    
     def generate_chapter(self, chapter_number: int, outline: Dict[str, Any], 
                         characters: List[Dict[str, Any]], context: str, 
-                        target_words: int = 3000) -> Dict[str, Any]:
+                        target_words: int = 3000,
+                        outline_json: str = None,
+                        characters_json: str = None) -> Dict[str, Any]:
         """
         生成单个章节
         
@@ -377,28 +620,183 @@ class NovelGenerator:
             characters: 人物列表
             context: 上下文信息
             target_words: 目标字数
+            outline_json: 预先序列化的大纲（批量生成时复用，可选）
+            characters_json: 预先选好并序列化的本章角色（可选）
             
         Returns:
             章节内容字典
         """
-        chain = LLMChain(
-            llm=self.llm,
-            prompt=self.chapter_template,
-            output_parser=self.output_parser
-        )
-        
         # 简化和筛选相关人物
-        relevant_chars = self._get_relevant_characters(chapter_number, characters)
+        if characters_json is None:
+            characters_json = _prompt_json(self._get_relevant_characters(chapter_number, characters))
+        
+        result = self._chapter_chain.invoke({
+            "chapter_number": chapter_number,
+            "outline": outline_json or _prompt_json(outline),
+            "characters": characters_json,
+            "context": context,
+            "target_words": target_words
+        })
+        
+        return self._normalize_chapter_result(chapter_number, result)
+    
+    async def generate_chapter_async(self, chapter_number: int, outline: Dict[str, Any], 
+                                     characters: List[Dict[str, Any]], context: str, 
+                                     target_words: int = 3000,
+                                     outline_json: str = None,
+                                     characters_json: str = None,
+                                     roster_json: str = None) -> Dict[str, Any]:
+        """
+        异步生成单个章节，供批量生成时并发调用
+        
+        Args:
+            chapter_number: 章节编号
+            outline: 小说大纲
+            characters: 人物列表
+            context: 上下文信息
+            target_words: 目标字数
+            outline_json: 预先序列化的大纲（批量生成时复用，可选）
+            characters_json: 预先选好并序列化的本章角色（可选）；提供roster_json时为本章出场人物名
+            roster_json: 整批共享的完整人物表（可选），提供时与大纲一起作为固定前缀发送
+            
+        Returns:
+            章节内容字典
+        """
+        if roster_json is not None:
+            if characters_json is None:
+                characters_json = "、".join(
+                    char.get('name', '') for char in self._get_relevant_characters(chapter_number, characters)
+                )
+            messages = self.batch_chapter_template.format_messages(
+                chapter_number=chapter_number,
+                outline=outline_json or _prompt_json(outline),
+                roster=roster_json,
+                characters=characters_json,
+                context=context,
+                target_words=target_words
+            )
+        else:
+            if characters_json is None:
+                characters_json = _prompt_json(self._get_relevant_characters(chapter_number, characters))
+            messages = self.chapter_template.format_messages(
+                chapter_number=chapter_number,
+                outline=outline_json or _prompt_json(outline),
+                characters=characters_json,
+                context=context,
+                target_words=target_words
+            )
+        
+        # 批量生成的热路径直接调用OpenAI兼容接口，跳过LangChain的回调和消息转换
+        text = await self._acall_chat(messages)
+        
+        return self._normalize_chapter_result(chapter_number, self.output_parser.parse(text))
+    
+    async def _acall_chat(self, messages: List[Any]) -> str:
+        """
+        直接调用DeepSeek聊天接口
+        
+        Args:
+            messages: LangChain消息列表
+            
+        Returns:
+            模型输出文本
+        """
+        response = await self._raw_client.chat.completions.create(
+            model=self.llm.model_name,
+            messages=[
+                {"role": _MESSAGE_ROLES.get(message.type, "user"), "content": message.content}
+                for message in messages
+            ],
+            temperature=self.llm.temperature,
+            max_tokens=self.llm.max_tokens
+        )
+        return response.choices[0].message.content or ""
+    
+    async def astream_chapter(self, chapter_number: int, outline: Dict[str, Any],
+                              characters: List[Dict[str, Any]], context: str,
+                              target_words: int = 3000,
+                              outline_json: str = None,
+                              characters_json: str = None,
+                              on_field_complete: Callable[[str, Any], None] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式生成单个章节，生成过程中不断产出已解析的部分结果
         
-        result = chain.run(
+        Args:
+            chapter_number: 章节编号
+            outline: 小说大纲
+            characters: 人物列表
+            context: 上下文信息
+            target_words: 目标字数
+            outline_json: 预先序列化的大纲（可选）
+            characters_json: 预先选好并序列化的本章角色（可选）
+            on_field_complete: 某个字段（如content）生成完毕时的回调，参数为字段名和值
+            
+        Yields:
+            部分章节字典（如已生成的title、content前半段）
+        """
+        if characters_json is None:
+            characters_json = _prompt_json(self._get_relevant_characters(chapter_number, characters))
+        messages = self.chapter_template.format_messages(
             chapter_number=chapter_number,
-            outline=json.dumps(outline, ensure_ascii=False),
-            characters=json.dumps(relevant_chars, ensure_ascii=False),
+            outline=outline_json or _prompt_json(outline),
+            characters=characters_json,
             context=context,
             target_words=target_words
         )
         
-        # 确保返回结构一致
+        async def text_chunks():
+            async for message_chunk in self.llm.astream(messages):
+                yield message_chunk.content
+        
+        # 模型按顺序输出字段：出现了后一个字段，前面的字段就已完整
+        completed = set()
+        partial = {}
+        async for partial in self.output_parser.parse_stream(text_chunks()):
+            if not isinstance(partial, dict):
+                continue
+            if on_field_complete:
+                for key in list(partial)[:-1]:
+                    if key not in completed:
+                        completed.add(key)
+                        on_field_complete(key, partial[key])
+            yield partial
+        
+        if on_field_complete and isinstance(partial, dict):
+            for key, value in partial.items():
+                if key not in completed:
+                    on_field_complete(key, value)
+    
+    def generate_chapter_streaming(self, chapter_number: int, outline: Dict[str, Any],
+                                   characters: List[Dict[str, Any]], context: str,
+                                   target_words: int = 3000,
+                                   on_field_complete: Callable[[str, Any], None] = None) -> Dict[str, Any]:
+        """
+        以流式方式生成单个章节并返回完整结果（同步调用）
+        
+        Args:
+            chapter_number: 章节编号
+            outline: 小说大纲
+            characters: 人物列表
+            context: 上下文信息
+            target_words: 目标字数
+            on_field_complete: 某个字段生成完毕时的回调（在后台事件循环线程中调用）
+            
+        Returns:
+            章节内容字典
+        """
+        async def collect():
+            result = None
+            async for partial in self.astream_chapter(
+                chapter_number, outline, characters, context, target_words,
+                on_field_complete=on_field_complete
+            ):
+                result = partial
+            return result
+        
+        return self._normalize_chapter_result(chapter_number, run_async(collect()) or {})
+    
+    def _normalize_chapter_result(self, chapter_number: int, result: Any) -> Dict[str, Any]:
+        """确保章节返回结构一致"""
         if not isinstance(result, dict):
             result = {
                 "title": f"第{chapter_number}章",
@@ -409,6 +807,16 @@ class NovelGenerator:
                 "character_development": {}
             }
         
+        # 提示词精简后仍校验必需字段，缺失时补默认值
+        for key, default in CHAPTER_EXPECTED_KEYS.items():
+            if not result.get(key):
+                result[key] = type(default)(default)
+        if not result['title']:
+            result['title'] = f"第{chapter_number}章"
+        result.setdefault('word_count', len(result['content']))
+        if result.get('truncated'):
+            logger.warning("⚠️ 第%d章输出被截断，已保留生成的%d字", chapter_number, len(result['content']))
+        
         return result
     
     def generate_chapter_plan(self, outline, target_words):
@@ -435,13 +843,22 @@ class NovelGenerator:
         
         return chapter_plan
     
-    def _get_relevant_characters(self, chapter_number: int, characters: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    @staticmethod
+    def _find_protagonists(characters: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """找出主角和重要配角（最多3个）"""
+        return [char for char in characters if char.get('name', '').startswith('主角')][:3]
+    
+    def _get_relevant_characters(self, chapter_number: int, characters: List[Dict[str, Any]],
+                                 seed: int = 0,
+                                 protagonists: List[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """
-        获取本章相关的角色
+        获取本章相关的角色（同一章节每次选出的角色相同，提示词可命中前缀缓存）
         
         Args:
             chapter_number: 章节编号
             characters: 所有角色
+            seed: 随机种子
+            protagonists: 预先找出的主角列表（批量生成时复用，可选）
             
         Returns:
             相关角色列表
@@ -449,17 +866,41 @@ class NovelGenerator:
         # 简单的规则：前几章引入主角，后续章节轮流出现
         if chapter_number <= 3:
             # 前3章只返回主角和重要配角
-            return [char for char in characters if char.get('name', '').startswith('主角')][:3]
+            if protagonists is None:
+                protagonists = self._find_protagonists(characters)
+            return list(protagonists)
+        elif not characters:
+            return []
         else:
-            # 随机选择2-4个角色
-            import random
-            return random.sample(characters, min(len(characters), random.randint(2, 4)))
+            # 按章节号确定性地随机选择2-4个角色
+            rng = random.Random(seed * 100003 + chapter_number)
+            return rng.sample(characters, min(len(characters), rng.randint(2, 4)))
+    
+    def _build_character_schedule(self, characters: List[Dict[str, Any]],
+                                  chapter_numbers: Iterable[int],
+                                  seed: int = 0) -> Dict[int, List[Dict[str, Any]]]:
+        """
+        一次性计算每章出场的角色
+        
+        Args:
+            characters: 所有角色
+            chapter_numbers: 章节编号
+            seed: 随机种子
+            
+        Returns:
+            章节编号到角色列表的映射
+        """
+        protagonists = self._find_protagonists(characters)
+        return {
+            chapter_number: self._get_relevant_characters(chapter_number, characters, seed, protagonists)
+            for chapter_number in chapter_numbers
+        }
     
     def batch_generate_chapters(self, start_chapter: int, count: int, 
                                outline: Dict[str, Any], characters: List[Dict[str, Any]], 
-                               memory_system: Any) -> List[Dict[str, Any]]:
+                               memory_system: Any, wave_size: int = 4) -> List[Dict[str, Any]]:
         """
-        批量生成章节
+        批量生成章节（在共享事件循环中分波并发请求）
         
         Args:
             start_chapter: 起始章节
@@ -467,35 +908,97 @@ class NovelGenerator:
             outline: 小说大纲
             characters: 人物列表
             memory_system: 记忆系统
+            wave_size: 每波并发生成的章节数
             
         Returns:
             生成的章节列表
         """
-        chapters = []
+        return run_async(self.abatch_generate_chapters(
+            start_chapter, count, outline, characters, memory_system, wave_size
+        ))
+    
+    async def abatch_generate_chapters(self, start_chapter: int, count: int,
+                                       outline: Dict[str, Any], characters: List[Dict[str, Any]],
+                                       memory_system: Any, wave_size: int = 4) -> List[Dict[str, Any]]:
+        """
+        异步批量生成章节
         
-        for i in range(count):
-            chapter_num = start_chapter + i
-            
-            # 获取上下文
-            context = memory_system.get_context(chapter_num)
-            
-            # 生成章节
-            chapter = self.generate_chapter(
-                chapter_number=chapter_num,
-                outline=outline,
-                characters=characters,
-                context=context
-            )
-            
-            chapters.append(chapter)
+        同一波内的章节并发请求；每波结束后按章节顺序更新记忆，
+        下一波的上下文就能包含前面已生成的章节。
+        
+        Args:
+            start_chapter: 起始章节
+            count: 生成数量
+            outline: 小说大纲
+            characters: 人物列表
+            memory_system: 记忆系统
+            wave_size: 每波并发生成的章节数
             
-            # 更新记忆系统
-            memory_system.update_with_chapter(chapter_num, chapter)
+        Returns:
+            生成的章节列表
+        """
+        chapters = []
+        wave_size = max(1, wave_size)
+        
+        # 大纲和完整人物表在整批中不变，只序列化一次，作为每章请求的相同前缀；
+        # 每章只发送出场人物名，不再重复发送人物设定
+        outline_json = _prompt_json(outline)
+        roster_json = _prompt_json(characters)
+        schedule = self._build_character_schedule(
+            characters, range(start_chapter, start_chapter + count)
+        )
+        relevant_names = {
+            num: "、".join(char.get('name', '') for char in chars)
+            for num, chars in schedule.items()
+        }
+        
+        # 读取上下文、更新记忆都是同步的磁盘和正则操作，放到线程池中执行，
+        # 避免阻塞共享事件循环中其他正在进行的请求
+        loop = asyncio.get_running_loop()
+        
+        def get_contexts(chapter_nums):
+            return [memory_system.get_context(chapter_num) for chapter_num in chapter_nums]
+        
+        def update_memory(chapter_nums, wave):
+            for chapter_num, chapter in zip(chapter_nums, wave):
+                memory_system.update_with_chapter(chapter_num, chapter)
+        
+        for wave_start in range(start_chapter, start_chapter + count, wave_size):
+            chapter_nums = range(wave_start, min(wave_start + wave_size, start_chapter + count))
+            
+            # 获取本波各章的上下文，再并发生成
+            contexts = await loop.run_in_executor(None, get_contexts, chapter_nums)
+            wave = await asyncio.gather(*[
+                self.generate_chapter_async(
+                    chapter_number=chapter_num,
+                    outline=outline,
+                    characters=characters,
+                    context=context,
+                    outline_json=outline_json,
+                    characters_json=relevant_names[chapter_num],
+                    roster_json=roster_json
+                )
+                for chapter_num, context in zip(chapter_nums, contexts)
+            ])
+            chapters.extend(wave)
+            
+            # 按顺序更新记忆系统（下一波的上下文依赖于此，等待完成后再继续）
+            await loop.run_in_executor(None, update_memory, chapter_nums, wave)
         
         return chapters
 
 # 示例使用
 if __name__ == "__main__":
+    # 测试解析器：非JSON输出回退为原文，不抛出异常
+    parser = JSONOutputParser()
+    assert parser.parse("抱歉，我无法生成该章节。") == {
+        "content": "抱歉，我无法生成该章节。",
+        "error": "JSON解析失败"
+    }
+    # 完整输出中的未转义换行不算截断，缺少结尾才算
+    assert parser.parse('{"content": "第一段\n第二段"}') == {"content": "第一段\n第二段"}
+    assert parser.parse('{"content": "第一段\n第二').get("truncated") is True
+    
     # 从环境变量获取API密钥
     api_key = os.getenv("DEEPSEEK_API_KEY")
     
@@ -3,16 +3,233 @@
 分层记忆架构解决百万字一致性问题 - 完整实现
 """
 
+import atexit
+import bisect
 import json
 import os
-from typing import Dict, List, Any, Optional, Tuple
+import re
+import sys
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, List, Any, Optional, Set, Tuple
 from pathlib import Path
 from datetime import datetime
-import hashlib
+import zlib
+# Support importing when module is executed as part of the package (relative import)
+# and when executed directly as a script (absolute import).
+try:
+    from ..utils.file_utils import dumps_json, loads_json
+except Exception:
+    from utils.file_utils import dumps_json, loads_json
+
+def _read_json(path: str, default: Any = None) -> Any:
+    """
+    读取JSON文件（按字节读取，交给orjson解析）
+    
+    Args:
+        path: 文件路径
+        default: 文件不存在或为空时的返回值
+        
+    Returns:
+        解析后的数据；格式错误时抛出json.JSONDecodeError
+    """
+    try:
+        with open(path, 'rb') as f:
+            content = f.read()
+    except FileNotFoundError:
+        return default
+    if not content.strip():
+        return default
+    return loads_json(content)
+
+def _summary_text(summary: Any) -> str:
+    """章节摘要可能是字典（新格式）或字符串（旧格式），统一取出摘要文本"""
+    if isinstance(summary, dict):
+        return summary.get('summary', '')
+    return str(summary)
+
+def _intern_keys(mapping: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    驻留字典的键（人名、地名）
+    
+    同一个名字在人物表、关系图、提及索引中反复作为键使用，
+    驻留后各处共用一个字符串对象，字典查找可以直接按身份比较。
+    """
+    return {sys.intern(key): value for key, value in mapping.items()}
+
+def _summary_word_count(summary: Any) -> int:
+    """章节字数（旧格式的摘要没有记录字数，按3000字估算）"""
+    if isinstance(summary, dict):
+        return summary.get('word_count', 3000)
+    return 3000
+
+def _consistency_estimate(char_data: Dict[str, Any]) -> int:
+    """人物一致性估分：有发展历史就认为是一致的"""
+    return 80 if char_data.get('development_history') else 50
+
+def _build_name_matcher(names) -> Tuple[Any, Dict[str, List[str]]]:
+    """
+    把所有人名编译成一个正则，一次扫描找出每个人名首次出现的位置
+    
+    Args:
+        names: 人名
+        
+    Returns:
+        (编译后的正则, 每个人名开头包含的更短人名)，没有人名时正则为None
+    """
+    unique_names = sorted({name for name in names if name}, key=len, reverse=True)
+    if not unique_names:
+        return None, {}
+    
+    # 零宽前瞻在每个位置都尝试匹配，同一位置只返回最长的人名，
+    # 以它开头的更短人名（如"李青云"中的"李青"）通过映射补齐
+    pattern = re.compile('(?=(' + '|'.join(map(re.escape, unique_names)) + '))')
+    prefixes = {
+        name: [other for other in unique_names if other != name and name.startswith(other)]
+        for name in unique_names
+    }
+    return pattern, prefixes
+
+@lru_cache(maxsize=8192)
+def _name_chapter_hash(name: str, chapter_number: int) -> int:
+    """
+    名称和章节编号的确定性哈希，用于相关性打分（同一输入每次结果相同）
+    
+    只需要跨进程稳定、分布均匀，不需要抗碰撞，所以用CRC32而不是MD5；
+    内置hash()对字符串加了随机盐，每次启动结果不同，不能使用。
+    
+    Args:
+        name: 人物或地点名称
+        chapter_number: 章节编号
+        
+    Returns:
+        非负整数哈希值
+    """
+    return zlib.crc32(f"{name}_{chapter_number}".encode('utf-8'))
+
+def _write_json(path: str, data: Any, indent: Optional[int] = 2):
+    """
+    把数据写成UTF-8 JSON文件
+    
+    先写临时文件并落盘，再原子替换目标文件：写入中途崩溃或断电时，
+    目标文件要么是旧内容要么是新内容，不会只剩半个文件。
+    
+    Args:
+        path: 目标文件路径
+        data: 要保存的数据
+        indent: 缩进空格数，None表示紧凑格式
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(dumps_json(data, indent=indent))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def _read_legacy_dir(directory: str) -> List[Tuple[str, Any]]:
+    """
+    读取旧版按条目拆分的目录（每个人物/情节/地点一个JSON文件）
+    
+    Args:
+        directory: 旧版目录
+        
+    Returns:
+        (文件名去掉扩展名, 数据) 列表，按文件名中的序号排序；格式错误的文件跳过
+    """
+    if not os.path.isdir(directory):
+        return []
+    
+    names = [file for file in os.listdir(directory) if file.endswith('.json')]
+    # plot_10.json 排在 plot_9.json 之后
+    names.sort(key=lambda file: (len(file), file))
+    
+    def read_entry(file):
+        try:
+            return _read_json(os.path.join(directory, file))
+        except json.JSONDecodeError:
+            print(f"⚠️ 文件 {directory}/{file} 格式错误，跳过")
+            return None
+    
+    # 大量小文件并发读取，读文件和解析JSON时会释放GIL
+    with ThreadPoolExecutor(max_workers=min(8, len(names) or 1)) as executor:
+        results = list(executor.map(read_entry, names))
+    
+    return [
+        (file[:-len('.json')], data)
+        for file, data in zip(names, results)
+        if data is not None
+    ]
+
+def _remove_legacy_dir(directory: str, names: List[str]):
+    """迁移完成后删除旧版目录中已合并的条目文件（无法解析的文件保留），目录为空时一并删除"""
+    for name in names:
+        os.remove(os.path.join(directory, f"{name}.json"))
+    try:
+        os.rmdir(directory)
+    except OSError:
+        pass
+
+def _hardlink_tree(src: str, dst: str):
+    """
+    用硬链接复制文件或目录树
+    
+    记忆文件都是写临时文件后替换（见_write_json），原文件的inode不会被改写，
+    所以备份中的硬链接始终保持备份时的内容。跨文件系统等无法链接时退回到复制。
+    
+    Args:
+        src: 源文件或目录
+        dst: 目标路径
+    """
+    if os.path.isdir(src):
+        os.makedirs(dst, exist_ok=True)
+        for entry in os.scandir(src):
+            _hardlink_tree(entry.path, os.path.join(dst, entry.name))
+        return
+    
+    try:
+        os.link(src, dst)
+    except OSError:
+        import shutil
+        shutil.copy2(src, dst)
+
+# 地点描述模式（"在……"、"来到……"、"位于……"），一次扫描完成
+_LOCATION_RE = re.compile(r'(?:在|来到|位于)([\u4e00-\u9fa5]{2,6})')
+
+# 进程退出时把所有记忆系统中未写盘的修改写回
+_live_memories = weakref.WeakSet()
+
+@atexit.register
+def _flush_live_memories():
+    for memory in list(_live_memories):
+        if memory._dirty:
+            memory._save_to_disk()
 
 class SmartMemory:
     """智能记忆系统 - 完整实现"""
     
+    # 各部分记忆对应的文件（相对memory_dir），只重写被修改过的部分
+    SHARD_FILES = {
+        'core_settings': 'core_settings.json',
+        'characters': 'characters.json',
+        'chapter_summaries': 'summaries/chapter_summaries.json',
+        'worldview': 'worldview.json',
+        'timeline': 'timeline.json',
+        'plots': 'plots.json',
+        'locations': 'locations.json'
+    }
+    
+    # 只由程序读写、随章节数增长的部分保存为紧凑JSON，其余保留缩进便于手工查看和修改
+    COMPACT_SHARDS = frozenset({'chapter_summaries', 'timeline'})
+    
+    # 两次自动备份之间的最短间隔（秒）
+    BACKUP_INTERVAL = 600
+    
+    # 缓存最近生成的上下文条数（记忆有任何修改时清空）
+    CONTEXT_CACHE_SIZE = 16
+    
     def __init__(self, memory_dir: str = "./memory"):
         self.memory_dir = memory_dir
         self.core_settings = {}      # 核心设定（永不遗忘）
@@ -24,118 +241,86 @@ class SmartMemory:
         self.plots = []              # 情节线
         self.locations = {}          # 地点档案
         
+        self._dirty = set()          # 修改过、尚未写盘的部分（SHARD_FILES的键）
+        self._summary_list = None    # 按章节编号排列的摘要（首次使用时构建）
+        self._timeline_chapters = None  # 时间线各事件的章节编号，与timeline一一对应
+        self._mention_index = None   # 章节编号 -> 摘要中提及的人物名（首次使用时构建）
+        self._name_matcher = None    # 所有人名编译成的正则（首次使用时构建）
+        self._character_buckets = None  # 按重要性分组的人物（首次使用时构建）
+        self._context_cache = OrderedDict()  # (章节编号, 窗口大小) -> 上下文字符串
+        self._search_blobs = {}      # 记忆部分 -> 预先拼接好的检索文本（修改后重新构建）
+        self._total_words = None     # 各章字数之和（首次统计时计算）
+        self._consistency_sum = None # 人物一致性估分之和（人物表修改后重新计算）
+        self._last_backup = None     # 上次备份的time.monotonic()；None表示本次运行尚未备份
+        
         self._ensure_directories()
         self._load_from_disk()
+        _live_memories.add(self)
     
     def _ensure_directories(self):
-        """确保必要的目录存在"""
-        directories = [
-            self.memory_dir,
-            f"{self.memory_dir}/characters",
-            f"{self.memory_dir}/summaries",
-            f"{self.memory_dir}/relationships",
-            f"{self.memory_dir}/plots",
-            f"{self.memory_dir}/locations",
-            f"{self.memory_dir}/backups"
-        ]
+        """
+        确保必要的目录存在
         
-        for directory in directories:
-            os.makedirs(directory, exist_ok=True)
+        记忆文件都在memory_dir下，只有章节摘要在summaries子目录中；
+        备份目录在第一次备份时创建。目录已存在时只需一次stat。
+        """
+        summaries_dir = f"{self.memory_dir}/summaries"
+        if not os.path.isdir(summaries_dir):
+            os.makedirs(summaries_dir, exist_ok=True)
     
     def _load_from_disk(self):
         """从磁盘加载记忆"""
         try:
             # 加载核心设定
-            core_file = f"{self.memory_dir}/core_settings.json"
-            if os.path.exists(core_file):
-                try:
-                    with open(core_file, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                        if content.strip():  # 检查文件是否为空
-                            self.core_settings = json.loads(content)
-                except json.JSONDecodeError:
-                    print(f"⚠️ 核心设定文件格式错误，使用默认值")
-                    self.core_settings = {}
-            
-            # 加载人物档案
-            characters_dir = f"{self.memory_dir}/characters"
-            if os.path.exists(characters_dir):
-                for file in os.listdir(characters_dir):
-                    if file.endswith('.json'):
-                        char_name = file.replace('.json', '')
-                        file_path = f"{characters_dir}/{file}"
-                        try:
-                            with open(file_path, 'r', encoding='utf-8') as f:
-                                content = f.read()
-                                if content.strip():
-                                    self.characters[char_name] = json.loads(content)
-                        except json.JSONDecodeError:
-                            print(f"⚠️ 人物文件 {file} 格式错误，跳过")
+            try:
+                self.core_settings = _read_json(f"{self.memory_dir}/core_settings.json", self.core_settings)
+            except json.JSONDecodeError:
+                print(f"⚠️ 核心设定文件格式错误，使用默认值")
+                self.core_settings = {}
+            
+            # 加载人物档案（所有人物打包在一个文件中）
+            try:
+                self.characters = _intern_keys(self._load_shard('characters', dict))
+            except json.JSONDecodeError:
+                print(f"⚠️ 人物档案文件格式错误，使用默认值")
+                self.characters = {}
             
             # 加载章节摘要
-            summaries_file = f"{self.memory_dir}/summaries/chapter_summaries.json"
-            if os.path.exists(summaries_file):
-                try:
-                    with open(summaries_file, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                        if content.strip():
-                            self.chapter_summaries = json.loads(content)
-                except json.JSONDecodeError:
-                    print(f"⚠️ 章节摘要文件格式错误，使用默认值")
-                    self.chapter_summaries = {}
+            try:
+                self.chapter_summaries = _read_json(
+                    f"{self.memory_dir}/summaries/chapter_summaries.json", self.chapter_summaries
+                )
+            except json.JSONDecodeError:
+                print(f"⚠️ 章节摘要文件格式错误，使用默认值")
+                self.chapter_summaries = {}
             
             # 加载世界观
-            worldview_file = f"{self.memory_dir}/worldview.json"
-            if os.path.exists(worldview_file):
-                try:
-                    with open(worldview_file, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                        if content.strip():
-                            self.worldview = json.loads(content)
-                except json.JSONDecodeError:
-                    print(f"⚠️ 世界观文件格式错误，使用默认值")
-                    self.worldview = {}
+            try:
+                self.worldview = _read_json(f"{self.memory_dir}/worldview.json", self.worldview)
+            except json.JSONDecodeError:
+                print(f"⚠️ 世界观文件格式错误，使用默认值")
+                self.worldview = {}
             
             # 加载时间线
-            timeline_file = f"{self.memory_dir}/timeline.json"
-            if os.path.exists(timeline_file):
-                try:
-                    with open(timeline_file, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                        if content.strip():
-                            self.timeline = json.loads(content)
-                except json.JSONDecodeError:
-                    print(f"⚠️ 时间线文件格式错误，使用默认值")
-                    self.timeline = []
+            try:
+                self.timeline = _read_json(f"{self.memory_dir}/timeline.json", self.timeline)
+            except json.JSONDecodeError:
+                print(f"⚠️ 时间线文件格式错误，使用默认值")
+                self.timeline = []
             
             # 加载情节线
-            plots_dir = f"{self.memory_dir}/plots"
-            if os.path.exists(plots_dir):
-                for file in os.listdir(plots_dir):
-                    if file.endswith('.json'):
-                        file_path = f"{plots_dir}/{file}"
-                        try:
-                            with open(file_path, 'r', encoding='utf-8') as f:
-                                content = f.read()
-                                if content.strip():
-                                    self.plots.append(json.loads(content))
-                        except json.JSONDecodeError:
-                            print(f"⚠️ 情节线文件 {file} 格式错误，跳过")
+            try:
+                self.plots = self._load_shard('plots', list)
+            except json.JSONDecodeError:
+                print(f"⚠️ 情节线文件格式错误，使用默认值")
+                self.plots = []
             
             # 加载地点
-            locations_dir = f"{self.memory_dir}/locations"
-            if os.path.exists(locations_dir):
-                for file in os.listdir(locations_dir):
-                    if file.endswith('.json'):
-                        loc_name = file.replace('.json', '')
-                        file_path = f"{locations_dir}/{file}"
-                        try:
-                            with open(file_path, 'r', encoding='utf-8') as f:
-                                content = f.read()
-                                if content.strip():
-                                    self.locations[loc_name] = json.loads(content)
-                        except json.JSONDecodeError:
-                            print(f"⚠️ 地点文件 {file} 格式错误，跳过")
+            try:
+                self.locations = _intern_keys(self._load_shard('locations', dict))
+            except json.JSONDecodeError:
+                print(f"⚠️ 地点文件格式错误，使用默认值")
+                self.locations = {}
             
             print(f"✅ 记忆系统加载完成: {len(self.characters)}人物, {len(self.chapter_summaries)}章节")
             
@@ -144,45 +329,79 @@ class SmartMemory:
             # 初始化默认结构
             self._init_default_structure()
     
-    def _save_to_disk(self):
-        """保存记忆到磁盘"""
+    def _load_shard(self, name: str, container: type) -> Any:
+        """
+        加载打包文件（characters.json、plots.json、locations.json）
+        
+        打包文件不存在而旧版的同名目录中有按条目拆分的文件时，读取后写成打包文件并删除旧文件。
+        
+        Args:
+            name: 打包文件名（不含扩展名），也是旧版目录名
+            container: dict或list
+            
+        Returns:
+            加载的数据
+        """
+        shard_path = f"{self.memory_dir}/{name}.json"
+        data = _read_json(shard_path)
+        if data is not None:
+            return data
+        
+        legacy_dir = f"{self.memory_dir}/{name}"
+        entries = _read_legacy_dir(legacy_dir)
+        if not entries:
+            return container()
+        
+        if container is dict:
+            data = dict(entries)
+        else:
+            data = [entry for _, entry in entries]
+        _write_json(shard_path, data)
+        _remove_legacy_dir(legacy_dir, [entry_name for entry_name, _ in entries])
+        print(f"✅ 已将 {legacy_dir} 下的{len(entries)}个文件合并为 {name}.json")
+        return data
+    
+    def _mark_dirty(self, *names: str):
+        """记录被修改的部分，下次保存时只重写这些文件"""
+        self._dirty.update(names)
+        self._context_cache.clear()
+        for name in names:
+            self._search_blobs.pop(name, None)
+        if 'chapter_summaries' in names:
+            self._total_words = None
+        if 'characters' in names:
+            self._consistency_sum = None
+    
+    def _save_to_disk(self, force: bool = False):
+        """
+        保存记忆到磁盘
+        
+        Args:
+            force: 为True时重写全部文件并立即备份；否则只写被修改的部分，
+                距上次备份超过BACKUP_INTERVAL时才备份
+                
+        Returns:
+            是否成功
+        """
         try:
-            # 创建备份
-            self._create_backup()
-            
-            # 保存核心设定
-            with open(f"{self.memory_dir}/core_settings.json", 'w', encoding='utf-8') as f:
-                json.dump(self.core_settings, f, ensure_ascii=False, indent=2)
-            
-            # 保存人物档案
-            for char_name, char_data in self.characters.items():
-                # 清理文件名中的非法字符
-                safe_name = "".join(c for c in char_name if c.isalnum() or c in " _-")
-                with open(f"{self.memory_dir}/characters/{safe_name}.json", 'w', encoding='utf-8') as f:
-                    json.dump(char_data, f, ensure_ascii=False, indent=2)
-            
-            # 保存章节摘要
-            with open(f"{self.memory_dir}/summaries/chapter_summaries.json", 'w', encoding='utf-8') as f:
-                json.dump(self.chapter_summaries, f, ensure_ascii=False, indent=2)
-            
-            # 保存世界观
-            with open(f"{self.memory_dir}/worldview.json", 'w', encoding='utf-8') as f:
-                json.dump(self.worldview, f, ensure_ascii=False, indent=2)
-            
-            # 保存时间线
-            with open(f"{self.memory_dir}/timeline.json", 'w', encoding='utf-8') as f:
-                json.dump(self.timeline, f, ensure_ascii=False, indent=2)
-            
-            # 保存情节线
-            for i, plot in enumerate(self.plots):
-                with open(f"{self.memory_dir}/plots/plot_{i+1}.json", 'w', encoding='utf-8') as f:
-                    json.dump(plot, f, ensure_ascii=False, indent=2)
-            
-            # 保存地点
-            for loc_name, loc_data in self.locations.items():
-                safe_name = "".join(c for c in loc_name if c.isalnum() or c in " _-")
-                with open(f"{self.memory_dir}/locations/{safe_name}.json", 'w', encoding='utf-8') as f:
-                    json.dump(loc_data, f, ensure_ascii=False, indent=2)
+            names = set(self.SHARD_FILES) if force else set(self._dirty)
+            if not names:
+                return True
+            
+            # 创建备份（保存的是本次修改前的文件）
+            if (force or self._last_backup is None
+                    or time.monotonic() - self._last_backup >= self.BACKUP_INTERVAL):
+                self._create_backup()
+                self._last_backup = time.monotonic()
+            
+            for name in self.SHARD_FILES:
+                if name in names:
+                    _write_json(
+                        f"{self.memory_dir}/{self.SHARD_FILES[name]}",
+                        getattr(self, name),
+                        indent=None if name in self.COMPACT_SHARDS else 2
+                    )
+                    self._dirty.discard(name)
             
             return True
             
@@ -190,22 +409,25 @@ class SmartMemory:
             print(f"❌ 保存记忆失败: {str(e)}")
             return False
     
+    def flush(self) -> bool:
+        """把全部记忆写回磁盘并创建备份"""
+        return self._save_to_disk(force=True)
+    
     def _create_backup(self):
-        """创建备份"""
+        """创建备份（硬链接快照：未修改的文件不复制数据）"""
         try:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             backup_dir = f"{self.memory_dir}/backups/{timestamp}"
-            os.makedirs(backup_dir, exist_ok=True)
+            if os.path.exists(backup_dir):
+                # 同一秒内已经备份过
+                return
+            os.makedirs(backup_dir)
             
-            # 复制当前文件到备份目录
+            # 把当前文件链接到备份目录
             import shutil
-            for item in os.listdir(self.memory_dir):
-                if item != "backups":
-                    src = os.path.join(self.memory_dir, item)
-                    if os.path.isfile(src):
-                        shutil.copy2(src, backup_dir)
-                    elif os.path.isdir(src):
-                        shutil.copytree(src, os.path.join(backup_dir, item))
+            for entry in os.scandir(self.memory_dir):
+                if entry.name != "backups":
+                    _hardlink_tree(entry.path, os.path.join(backup_dir, entry.name))
             
             # 清理旧备份（保留最近5个）
             backups = sorted(os.listdir(f"{self.memory_dir}/backups"))
@@ -220,6 +442,7 @@ class SmartMemory:
         """保存章节计划 - 简单实现"""
         # 保存到核心设定中
         self.core_settings['chapter_plan'] = chapter_plan
+        self._mark_dirty('core_settings')
         self._save_to_disk()
         
     def get_chapter_plan(self):
@@ -229,19 +452,23 @@ class SmartMemory:
     def save_core_settings(self, settings: Dict[str, Any]):
         """保存核心设定"""
         self.core_settings.update(settings)
+        self._mark_dirty('core_settings')
         self._save_to_disk()
     
     def save_characters(self, characters: List[Dict[str, Any]]):
         """保存人物设定"""
+        now = datetime.now().isoformat()
         for char in characters:
-            char_name = char.get('name', 'unknown')
+            char_name = sys.intern(char.get('name', 'unknown'))
             self.characters[char_name] = char
             
             # 添加时间戳
             if 'created_at' not in self.characters[char_name]:
-                self.characters[char_name]['created_at'] = datetime.now().isoformat()
-            self.characters[char_name]['updated_at'] = datetime.now().isoformat()
+                self.characters[char_name]['created_at'] = now
+            self.characters[char_name]['updated_at'] = now
         
+        self._on_characters_changed()
+        self._mark_dirty('characters')
         self._save_to_disk()
     
     def save_worldview(self, worldview: Dict[str, Any]):
@@ -251,7 +478,9 @@ class SmartMemory:
         # 同时保存到核心设定
         if 'worldview' not in self.core_settings:
             self.core_settings['worldview'] = worldview
+            self._mark_dirty('core_settings')
         
+        self._mark_dirty('worldview')
         self._save_to_disk()
     
     def get_context(self, chapter_number: int, window_size: int = 5) -> str:
@@ -265,6 +494,20 @@ class SmartMemory:
         Returns:
             上下文字符串
         """
+        # 同一章节重复获取上下文（重试、一致性检查等）时直接返回上次的结果
+        key = (chapter_number, window_size)
+        context = self._context_cache.get(key)
+        if context is None:
+            context = self._build_context(chapter_number, window_size)
+            self._context_cache[key] = context
+            if len(self._context_cache) > self.CONTEXT_CACHE_SIZE:
+                self._context_cache.popitem(last=False)
+        else:
+            self._context_cache.move_to_end(key)
+        return context
+    
+    def _build_context(self, chapter_number: int, window_size: int) -> str:
+        """拼接章节上下文（见get_context）"""
         context_parts = []
         
         # 1. 核心设定（总是包含）
@@ -336,35 +579,49 @@ class SmartMemory:
     
     def _get_relevant_characters(self, chapter_number: int) -> Dict[str, Dict]:
         """获取相关人物"""
-        relevant_chars = {}
+        always_included, others = self._get_character_buckets()
         
         # 规则1: 主角总是在相关人物中
-        for name, data in self.characters.items():
-            if "主角" in name or data.get('importance', 0) >= 8:
-                relevant_chars[name] = data
+        relevant_chars = dict(always_included)
         
-        # 规则2: 根据章节编号选择其他人物
+        # 规则2: 根据章节编号选择其他人物（按重要性从高到低，达到上限即停止）
         if chapter_number <= 3:
             # 前3章: 引入主要配角
-            for name, data in self.characters.items():
-                if data.get('importance', 0) >= 6 and name not in relevant_chars:
-                    relevant_chars[name] = data
-                    if len(relevant_chars) >= 5:  # 最多5个
-                        break
+            for name, data in others:
+                if len(relevant_chars) >= 5 or data.get('importance', 0) < 6:  # 最多5个
+                    break
+                relevant_chars[name] = data
         else:
             # 后续章节: 根据章节编号和人物重要性选择
-            for name, data in self.characters.items():
-                # 计算人物相关性分数
-                relevance_score = self._calculate_character_relevance(name, chapter_number)
-                
-                if relevance_score >= 0.3 or data.get('importance', 0) >= 7:
-                    relevant_chars[name] = data
-                
+            for name, data in others:
                 if len(relevant_chars) >= 8:  # 最多8个
                     break
+                
+                # 重要人物直接入选，其余计算人物相关性分数
+                if data.get('importance', 0) >= 7 or self._calculate_character_relevance(name, chapter_number) >= 0.3:
+                    relevant_chars[name] = data
         
         return relevant_chars
     
+    def _get_character_buckets(self) -> Tuple[Dict[str, Dict], List[Tuple[str, Dict]]]:
+        """
+        获取人物分组（人物表变化后重新构建）
+        
+        Returns:
+            (总是入选的主角和核心人物, 其余人物按重要性从高到低排列)
+        """
+        if self._character_buckets is None:
+            always_included = {}
+            others = []
+            for name, data in self.characters.items():
+                if "主角" in name or data.get('importance', 0) >= 8:
+                    always_included[name] = data
+                else:
+                    others.append((name, data))
+            others.sort(key=lambda item: item[1].get('importance', 0), reverse=True)
+            self._character_buckets = (always_included, others)
+        return self._character_buckets
+    
     def _calculate_character_relevance(self, character_name: str, chapter_number: int) -> float:
         """计算人物相关性分数"""
         if character_name not in self.characters:
@@ -392,8 +649,7 @@ class SmartMemory:
             relevance += min(0.2, len(dev_history) * 0.02)
         
         # 4. 与章节编号的哈希关系（确保一致性）
-        hash_input = f"{character_name}_{chapter_number}"
-        hash_val = int(hashlib.md5(hash_input.encode()).hexdigest(), 16)
+        hash_val = _name_chapter_hash(character_name, chapter_number)
         hash_score = (hash_val % 100) / 100.0
         
         # 5. 在最近摘要中的提及
@@ -404,27 +660,80 @@ class SmartMemory:
     
     def _count_character_mentions(self, character_name: str, up_to_chapter: int) -> int:
         """统计人物在最近摘要中的提及次数"""
-        count = 0
-        for chap_num in range(max(1, up_to_chapter - 5), up_to_chapter):
-            summary = self.chapter_summaries.get(str(chap_num), "")
-            if summary and character_name in summary:
-                count += 1
-        return count
+        mention_index = self._get_mention_index()
+        return sum(
+            1 for mentions in mention_index[max(1, up_to_chapter - 5):up_to_chapter]
+            if mentions and character_name in mentions
+        )
+    
+    def _get_mention_index(self) -> List[Optional[Set[str]]]:
+        """获取章节到提及人物的倒排索引，下标为章节编号（人物表变化后重新构建）"""
+        if self._mention_index is None:
+            self._mention_index = [
+                self._find_mentions(summary) if summary else None
+                for summary in self._get_summary_list()
+            ]
+        return self._mention_index
+    
+    def _get_summary_list(self) -> List[Any]:
+        """
+        获取按章节编号排列的摘要列表（下标为章节编号，缺失的章节为None）
+        
+        chapter_summaries以字符串为键便于保存为JSON，按章节范围取摘要时用这个列表直接切片。
+        """
+        if self._summary_list is None:
+            numbered = {
+                int(chap_key): summary
+                for chap_key, summary in self.chapter_summaries.items()
+                if str(chap_key).isdigit()
+            }
+            summary_list = [None] * (max(numbered, default=0) + 1)
+            for chap_num, summary in numbered.items():
+                summary_list[chap_num] = summary
+            self._summary_list = summary_list
+        return self._summary_list
+    
+    @staticmethod
+    def _set_indexed(index: Optional[List[Any]], chapter_number: int, value: Any):
+        """更新按章节编号排列的列表（尚未构建时跳过，不够长时补None）"""
+        if index is None:
+            return
+        if len(index) <= chapter_number:
+            index.extend([None] * (chapter_number + 1 - len(index)))
+        index[chapter_number] = value
+    
+    def _reset_indexes(self):
+        """整体替换记忆后丢弃所有派生的索引和缓存"""
+        self._context_cache.clear()
+        self._search_blobs.clear()
+        self._summary_list = None
+        self._timeline_chapters = None
+        self._total_words = None
+        self._consistency_sum = None
+        self._on_characters_changed()
+    
+    def _on_characters_changed(self):
+        """人物表变化后丢弃基于人名构建的索引，下次使用时重新构建"""
+        self._mention_index = None
+        self._name_matcher = None
+        self._character_buckets = None
+    
+    def _find_mentions(self, summary: Any) -> Set[str]:
+        """找出摘要中提及的人物名"""
+        text = _summary_text(summary)
+        return {name for name in self.characters if name in text}
     
     def _get_recent_summaries(self, current_chapter: int, window_size: int = 5) -> List[Tuple[int, str]]:
         """获取最近章节摘要"""
         recent = []
         
         start_chapter = max(1, current_chapter - window_size)
+        window = self._get_summary_list()[start_chapter:current_chapter]
         
-        for chap_num in range(start_chapter, current_chapter):
-            summary = self.chapter_summaries.get(str(chap_num))
+        for chap_num, summary in enumerate(window, start_chapter):
             if summary:
                 # 如果摘要太长，截断
-                if isinstance(summary, dict):
-                    summary_text = summary.get('summary', '')
-                else:
-                    summary_text = str(summary)
+                summary_text = _summary_text(summary)
                 
                 if len(summary_text) > 200:
                     summary_text = summary_text[:200] + "..."
@@ -435,18 +744,23 @@ class SmartMemory:
     
     def _get_timeline_events(self, up_to_chapter: int) -> List[str]:
         """获取时间线事件"""
-        events = []
-        
-        for event in self.timeline:
-            event_chapter = event.get('chapter', 0)
-            if 0 < event_chapter <= up_to_chapter:
-                event_desc = event.get('description', '')
-                events.append(f"第{event_chapter}章: {event_desc}")
-        
-        # 按章节排序
-        events.sort(key=lambda x: int(x.split('第')[1].split('章')[0]))
-        
-        return events[-10:]  # 最多返回10个最近事件
+        # 时间线按章节排序，二分查找出第1章到up_to_chapter章的范围
+        timeline_chapters = self._get_timeline_chapters()
+        start = bisect.bisect_right(timeline_chapters, 0)
+        end = bisect.bisect_right(timeline_chapters, up_to_chapter)
+        
+        # 最多返回10个最近事件
+        return [
+            f"第{event.get('chapter', 0)}章: {event.get('description', '')}"
+            for event in self.timeline[max(start, end - 10):end]
+        ]
+    
+    def _get_timeline_chapters(self) -> List[int]:
+        """获取时间线各事件的章节编号（首次使用时把时间线按章节稳定排序）"""
+        if self._timeline_chapters is None:
+            self.timeline.sort(key=lambda event: event.get('chapter', 0))
+            self._timeline_chapters = [event.get('chapter', 0) for event in self.timeline]
+        return self._timeline_chapters
     
     def _get_relevant_locations(self, chapter_number: int) -> Dict[str, Dict]:
         """获取相关地点"""
@@ -455,8 +769,7 @@ class SmartMemory:
         # 简单实现：根据章节编号选择
         for name, data in self.locations.items():
             # 根据名称哈希决定是否相关
-            hash_input = f"{name}_{chapter_number}"
-            hash_val = int(hashlib.md5(hash_input.encode()).hexdigest(), 16)
+            hash_val = _name_chapter_hash(name, chapter_number)
             
             if hash_val % 3 == 0:  # 约1/3的地点相关
                 relevant_locs[name] = data
@@ -481,6 +794,8 @@ class SmartMemory:
     
     def update_with_chapter(self, chapter_number: int, chapter_data: Dict[str, Any]):
         """用章节数据更新记忆系统"""
+        # 本章所有记录共用一个时间戳
+        now = datetime.now().isoformat()
         
         # 提取章节摘要
         summary = chapter_data.get('summary', '')
@@ -495,10 +810,23 @@ class SmartMemory:
             'chapter_number': chapter_number,
             'word_count': len(chapter_data.get('content', '')),
             'key_events': chapter_data.get('key_events', []),
-            'timestamp': datetime.now().isoformat()
+            'timestamp': now
         }
         
+        # 总字数已统计过时按差值更新，不必重新遍历所有章节
+        total_words = self._total_words
+        if total_words is not None:
+            previous = self.chapter_summaries.get(str(chapter_number))
+            if previous is not None:
+                total_words -= _summary_word_count(previous)
+            total_words += chapter_summary['word_count']
+        
         self.chapter_summaries[str(chapter_number)] = chapter_summary
+        self._mark_dirty('chapter_summaries')
+        self._total_words = total_words
+        self._set_indexed(self._summary_list, chapter_number, chapter_summary)
+        if self._mention_index is not None:
+            self._set_indexed(self._mention_index, chapter_number, self._find_mentions(chapter_summary))
         
         # 提取人物发展
         character_development = chapter_data.get('character_development', {})
@@ -514,24 +842,31 @@ class SmartMemory:
                 self.characters[char_name]['development_history'].append({
                     'chapter': chapter_number,
                     'development': development,
-                    'timestamp': datetime.now().isoformat()
+                    'timestamp': now
                 })
+                self._mark_dirty('characters')
         
-        # 提取关键事件并添加到时间线
+        # 提取关键事件并添加到时间线（插入到同章节事件之后，保持按章节排序）
         key_events = chapter_data.get('key_events', [])
+        timeline_chapters = self._get_timeline_chapters()
+        position = bisect.bisect_right(timeline_chapters, chapter_number)
         for event in key_events:
-            self.timeline.append({
+            self.timeline.insert(position, {
                 'chapter': chapter_number,
                 'description': event,
-                'timestamp': datetime.now().isoformat(),
+                'timestamp': now,
                 'type': 'chapter_event'
             })
+            timeline_chapters.insert(position, chapter_number)
+            position += 1
+        if key_events:
+            self._mark_dirty('timeline')
         
         # 提取地点信息
-        self._extract_locations(chapter_data.get('content', ''), chapter_number)
+        self._extract_locations(chapter_data.get('content', ''), chapter_number, now)
         
         # 提取情节信息
-        self._extract_plots(chapter_data, chapter_number)
+        self._extract_plots(chapter_data, chapter_number, now)
         
         # 更新关系图
         self._update_relationships(chapter_data, chapter_number)
@@ -541,27 +876,15 @@ class SmartMemory:
         
         print(f"✅ 第{chapter_number}章记忆已更新")
     
-    def _extract_locations(self, content: str, chapter_number: int):
-        """从内容中提取地点信息"""
-        # 简单实现：识别可能的地点名称
-        import re
-        
-        # 识别地点描述模式
-        location_patterns = [
-            r'在([\u4e00-\u9fa5]{2,6})地?区?',
-            r'来到([\u4e00-\u9fa5]{2,6})',
-            r'位于([\u4e00-\u9fa5]{2,6})',
-            r'([\u4e00-\u9fa5]{2,6})中?'
-        ]
-        
-        locations_found = set()
-        for pattern in location_patterns:
-            matches = re.findall(pattern, content)
-            for match in matches:
-                if len(match) >= 2:  # 至少2个字的可能是地点
-                    locations_found.add(match)
+    def _extract_locations(self, content: str, chapter_number: int, now: str = None):
+        """从内容中提取地点信息（now为记录用的时间戳，默认取当前时间）"""
+        # 简单实现：识别"在/来到/位于"之后的2-6个汉字
+        locations_found = set(map(sys.intern, _LOCATION_RE.findall(content)))
         
         # 更新地点档案
+        if locations_found:
+            self._mark_dirty('locations')
+            now = now or datetime.now().isoformat()
         for loc_name in locations_found:
             if loc_name not in self.locations:
                 self.locations[loc_name] = {
@@ -570,17 +893,19 @@ class SmartMemory:
                     'last_appearance': chapter_number,
                     'appearance_count': 1,
                     'description': f"在{loc_name}发生的事件",
-                    'created_at': datetime.now().isoformat()
+                    'created_at': now
                 }
             else:
                 self.locations[loc_name]['last_appearance'] = chapter_number
                 self.locations[loc_name]['appearance_count'] += 1
     
-    def _extract_plots(self, chapter_data: Dict[str, Any], chapter_number: int):
-        """从章节中提取情节信息"""
+    def _extract_plots(self, chapter_data: Dict[str, Any], chapter_number: int, now: str = None):
+        """从章节中提取情节信息（now为记录用的时间戳，默认取当前时间）"""
         key_events = chapter_data.get('key_events', [])
         
         if key_events:
+            now = now or datetime.now().isoformat()
+            self._mark_dirty('plots')
             # 检查是否属于现有情节线
             for plot in self.plots:
                 plot_keywords = plot.get('keywords', [])
@@ -590,7 +915,7 @@ class SmartMemory:
                         if 'chapters' not in plot:
                             plot['chapters'] = []
                         plot['chapters'].append(chapter_number)
-                        plot['last_updated'] = datetime.now().isoformat()
+                        plot['last_updated'] = now
                         break
             
             # 创建新的情节线（如果事件足够重要）
@@ -601,7 +926,7 @@ class SmartMemory:
                     'end_chapter': chapter_number,  # 初始值，后续会更新
                     'keywords': key_events[:3],  # 前3个事件作为关键词
                     'chapters': [chapter_number],
-                    'created_at': datetime.now().isoformat(),
+                    'created_at': now,
                     'current_status': '进行中'
                 }
                 self.plots.append(new_plot)
@@ -611,19 +936,17 @@ class SmartMemory:
         content = chapter_data.get('content', '')
         
         # 简单实现：检测人物互动
-        character_interactions = []
+        # 一次扫描得到每个人名首次出现的位置，只在出现过的人物之间配对
+        first_positions = self._find_first_positions(content)
+        present = [name for name in self.characters if name in first_positions]
         
-        for char1 in self.characters:
-            for char2 in self.characters:
-                if char1 != char2:
-                    # 检查两个人物是否在同一段落中被提及
-                    if char1 in content and char2 in content:
-                        # 计算提及距离
-                        pos1 = content.find(char1)
-                        pos2 = content.find(char2)
-                        
-                        if abs(pos1 - pos2) < 500:  # 500字符内视为有关联
-                            character_interactions.append((char1, char2))
+        # 关系不分方向，每对人物只记录一次（键按人名排序，"甲-乙"和"乙-甲"是同一条）
+        character_interactions = []
+        for i, char1 in enumerate(present):
+            for char2 in present[i + 1:]:
+                # 计算提及距离
+                if abs(first_positions[char1] - first_positions[char2]) < 500:  # 500字符内视为有关联
+                    character_interactions.append(tuple(sorted((char1, char2))))
         
         # 更新关系图
         for char1, char2 in character_interactions:
@@ -647,6 +970,31 @@ class SmartMemory:
                 if chapter_number not in rel['interaction_chapters']:
                     rel['interaction_chapters'].append(chapter_number)
     
+    def _find_first_positions(self, content: str) -> Dict[str, int]:
+        """
+        查找每个人名在正文中首次出现的位置
+        
+        Args:
+            content: 章节正文
+            
+        Returns:
+            人名到位置的映射（未出现的人名不在其中）
+        """
+        if self._name_matcher is None:
+            self._name_matcher = _build_name_matcher(self.characters)
+        pattern, prefixes = self._name_matcher
+        if pattern is None or not content:
+            return {}
+        
+        first_positions = {}
+        for match in pattern.finditer(content):
+            name = match.group(1)
+            position = match.start()
+            first_positions.setdefault(name, position)
+            for prefix in prefixes[name]:
+                first_positions.setdefault(prefix, position)
+        return first_positions
+    
     def get_character_profile(self, character_name: str) -> Optional[Dict[str, Any]]:
         """获取人物完整档案"""
         return self.characters.get(character_name)
@@ -656,6 +1004,9 @@ class SmartMemory:
         if character_name in self.characters:
             self.characters[character_name].update(updates)
             self.characters[character_name]['updated_at'] = datetime.now().isoformat()
+            if 'importance' in updates:
+                self._character_buckets = None
+            self._mark_dirty('characters')
             self._save_to_disk()
     
     def add_relationship(self, char1: str, char2: str, relationship: str):
@@ -767,13 +1118,10 @@ class SmartMemory:
         """获取进度统计"""
         generated_chapters = len(self.chapter_summaries)
         
-        # 计算总字数
-        total_words = 0
-        for chap_num, summary_data in self.chapter_summaries.items():
-            if isinstance(summary_data, dict):
-                total_words += summary_data.get('word_count', 3000)
-            else:
-                total_words += 3000  # 默认估算
+        # 计算总字数（结果缓存，摘要修改后重新统计）
+        if self._total_words is None:
+            self._total_words = sum(map(_summary_word_count, self.chapter_summaries.values()))
+        total_words = self._total_words
         
         # 从大纲获取目标字数
         outline = self.core_settings.get('outline', {})
@@ -785,16 +1133,10 @@ class SmartMemory:
         else:
             percentage = 0
         
-        # 计算平均一致性（简单估算）
-        consistency_scores = []
-        for char_data in self.characters.values():
-            dev_history = char_data.get('development_history', [])
-            if dev_history:
-                consistency_scores.append(80)  # 假设有发展历史就是一致的
-            else:
-                consistency_scores.append(50)  # 默认分数
-        
-        avg_consistency = sum(consistency_scores) / len(consistency_scores) if consistency_scores else 0
+        # 计算平均一致性（简单估算，结果缓存，人物表修改后重新统计）
+        if self._consistency_sum is None:
+            self._consistency_sum = sum(map(_consistency_estimate, self.characters.values()))
+        avg_consistency = self._consistency_sum / len(self.characters) if self.characters else 0
         
         return {
             'generated_chapters': generated_chapters,
@@ -819,6 +1161,8 @@ class SmartMemory:
         self.timeline = []
         self.plots = []
         self.locations = {}
+        self._dirty.clear()
+        self._reset_indexes()
         
         # 删除磁盘文件
         import shutil
@@ -844,8 +1188,7 @@ class SmartMemory:
                 'version': '1.0'
             }
             
-            with open(export_path, 'w', encoding='utf-8') as f:
-                json.dump(export_data, f, ensure_ascii=False, indent=2)
+            _write_json(export_path, export_data)
             
             print(f"✅ 记忆系统已导出到: {export_path}")
             return True
@@ -861,8 +1204,7 @@ class SmartMemory:
                 print(f"❌ 导入文件不存在: {import_path}")
                 return False
             
-            with open(import_path, 'r', encoding='utf-8') as f:
-                import_data = json.load(f)
+            import_data = _read_json(import_path)
             
             # 验证导入数据
             required_keys = ['core_settings', 'characters', 'worldview', 'chapter_summaries']
@@ -873,15 +1215,16 @@ class SmartMemory:
             
             # 更新记忆
             self.core_settings = import_data['core_settings']
-            self.characters = import_data['characters']
+            self.characters = _intern_keys(import_data['characters'])
             self.worldview = import_data['worldview']
             self.chapter_summaries = import_data['chapter_summaries']
             self.timeline = import_data.get('timeline', [])
             self.plots = import_data.get('plots', [])
-            self.locations = import_data.get('locations', {})
+            self.locations = _intern_keys(import_data.get('locations', {}))
+            self._reset_indexes()
             
             # 保存到磁盘
-            self._save_to_disk()
+            self._save_to_disk(force=True)
             
             print(f"✅ 记忆系统已从 {import_path} 导入")
             return True
@@ -894,23 +1237,19 @@ class SmartMemory:
         """搜索记忆系统"""
         results = []
         
-        # 搜索人物
-        for char_name, char_data in self.characters.items():
-            if query.lower() in char_name.lower() or query in str(char_data).lower():
+        # 搜索人物（名字和档案都不区分大小写）
+        query_lower = query.lower()
+        for char_name, blob in self._get_search_blobs('characters'):
+            if query_lower in blob:
                 results.append({
                     'type': 'character',
                     'name': char_name,
-                    'data': char_data,
+                    'data': self.characters[char_name],
                     'relevance': 1.0
                 })
         
         # 搜索章节摘要
-        for chap_num, summary_data in self.chapter_summaries.items():
-            if isinstance(summary_data, dict):
-                summary_text = summary_data.get('summary', '')
-            else:
-                summary_text = str(summary_data)
-            
+        for chap_num, summary_text in self._get_search_blobs('chapter_summaries'):
             if query in summary_text:
                 results.append({
                     'type': 'chapter_summary',
@@ -919,18 +1258,48 @@ class SmartMemory:
                     'relevance': 0.8
                 })
         
-        # 搜索时间线事件
-        for event in self.timeline:
-            if query in event.get('description', ''):
+        # 搜索时间线事件（只扫描描述列表，命中后再取事件本身）
+        for index, description in enumerate(self._get_search_blobs('timeline')):
+            if query in description:
                 results.append({
                     'type': 'timeline_event',
-                    'event': event,
+                    'event': self.timeline[index],
                     'relevance': 0.7
                 })
         
         # 按相关性排序并限制数量
         results.sort(key=lambda x: x['relevance'], reverse=True)
         return results[:limit]
+    
+    def _get_search_blobs(self, name: str) -> List[Any]:
+        """
+        获取检索文本（首次搜索时构建，对应部分被修改后重新构建）
+        
+        Args:
+            name: 'characters'、'chapter_summaries'或'timeline'
+            
+        Returns:
+            人物和章节摘要为 (人物名或章节键, 检索文本) 列表，人物的检索文本为名字和档案的小写形式；
+            时间线为与timeline一一对应的事件描述列表
+        """
+        blobs = self._search_blobs.get(name)
+        if blobs is None:
+            if name == 'characters':
+                blobs = [
+                    (char_name, f"{char_name}\x00{char_data}".lower())
+                    for char_name, char_data in self.characters.items()
+                ]
+            elif name == 'timeline':
+                # 先确保时间线已按章节排好序，之后的排序不会让描述列表错位
+                self._get_timeline_chapters()
+                blobs = [event.get('description', '') for event in self.timeline]
+            else:
+                blobs = [
+                    (chap_num, _summary_text(summary_data))
+                    for chap_num, summary_data in self.chapter_summaries.items()
+                ]
+            self._search_blobs[name] = blobs
+        return blobs
 
 # 测试函数
 if __name__ == "__main__":
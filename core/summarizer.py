@@ -3,16 +3,44 @@
 生成章节摘要，保留关键信息
 """
 
+import bisect
 import json
+import re
+from collections import OrderedDict
 from typing import Dict, List, Any
 from langchain.chains import LLMChain
 from langchain.prompts import PromptTemplate
 
+# 预编译的正则：句子分隔符、连续汉字、可能的人名（3-5个汉字）
+_SENTENCE_SPLIT_RE = re.compile(r'[。！？]')
+_CHINESE_RE = re.compile(r'[\u4e00-\u9fa5]+')
+_NAME_RE = re.compile(r'[\u4e00-\u9fa5]{2,4}[\u4e00-\u9fa5]')
+
+# 关键信息提取的指示词（类别 -> 指示词）及每类保留的句子数
+_KEY_INDICATORS = {
+    "important_events": ['发现', '遇到', '战斗', '死亡', '获得', '失去', '决定', '承诺'],
+    "new_settings": ['世界', '法则', '力量', '系统', '组织', '门派'],
+    "potential_foreshadowing": ['未来', '将会', '可能', '似乎', '暗示', '预兆']
+}
+_KEY_LIMITS = {"important_events": 5, "new_settings": 3, "potential_foreshadowing": 3}
+_INDICATOR_CATEGORY = {
+    indicator: category
+    for category, indicators in _KEY_INDICATORS.items()
+    for indicator in indicators
+}
+# 所有指示词合成一个正则，每个句子只扫描一遍；前瞻匹配保证重叠的指示词也不会漏掉
+_INDICATOR_RE = re.compile('(?=(%s))' % '|'.join(map(re.escape, _INDICATOR_CATEGORY)))
+
 class SmartSummarizer:
     """智能摘要系统"""
     
+    # 缓存最近提取过关键信息的内容条数
+    KEY_INFO_CACHE_SIZE = 64
+    
     def __init__(self, llm=None):
         self.llm = llm
+        self._chains = {}  # 模板名 -> (创建时的llm, LLMChain)
+        self._key_info_cache = OrderedDict()  # 内容 -> 关键信息字典
         self._init_templates()
     
     def _init_templates(self):
@@ -77,6 +105,23 @@ class SmartSummarizer:
             """
         )
     
+    def _get_chain(self, name: str, template: PromptTemplate) -> LLMChain:
+        """
+        获取缓存的LLMChain（首次使用时创建，llm被替换后重新创建）
+        
+        Args:
+            name: 缓存键
+            template: 提示模板
+            
+        Returns:
+            LLMChain对象
+        """
+        cached = self._chains.get(name)
+        if cached is None or cached[0] is not self.llm:
+            cached = (self.llm, LLMChain(llm=self.llm, prompt=template))
+            self._chains[name] = cached
+        return cached[1]
+    
     def create_chapter_summary(self, content: str, chapter_number: int) -> Dict[str, Any]:
         """
         生成章节摘要
@@ -90,10 +135,7 @@ class SmartSummarizer:
         """
         if self.llm:
             # 使用LLM生成智能摘要
-            chain = LLMChain(
-                llm=self.llm,
-                prompt=self.chapter_summary_template
-            )
+            chain = self._get_chain("chapter", self.chapter_summary_template)
             
             result = chain.run(
                 content=content[:5000],  # 限制长度
@@ -134,15 +176,13 @@ class SmartSummarizer:
         """
         if self.llm and chapter_summaries:
             # 准备章节摘要文本
-            summaries_text = ""
-            for i, summary in enumerate(chapter_summaries, 1):
-                summaries_text += f"第{i}章: {summary.get('summary', '')}\n"
-            
-            chain = LLMChain(
-                llm=self.llm,
-                prompt=self.volume_summary_template
+            summaries_text = "".join(
+                f"第{i}章: {summary.get('summary', '')}\n"
+                for i, summary in enumerate(chapter_summaries, 1)
             )
             
+            chain = self._get_chain("volume", self.volume_summary_template)
+            
             result = chain.run(
                 chapter_summaries=summaries_text,
                 volume_number=volume_number
@@ -160,9 +200,9 @@ class SmartSummarizer:
                 }
         else:
             # 简单实现：合并章节摘要
-            combined_summary = ""
-            for summary in chapter_summaries:
-                combined_summary += summary.get('summary', '') + " "
+            combined_summary = "".join(
+                summary.get('summary', '') + " " for summary in chapter_summaries
+            )
             
             return {
                 "summary": combined_summary[:300] + "..." if len(combined_summary) > 300 else combined_summary,
@@ -182,9 +222,22 @@ class SmartSummarizer:
         Returns:
             关键信息字典
         """
-        # 简单实现：提取重要元素
-        import re
+        # 同一章节重复提取（界面刷新、一致性检查等）时直接复用上次的结果
+        info = self._key_info_cache.get(content)
+        if info is None:
+            info = self._extract_key_information(content)
+            self._key_info_cache[content] = info
+            if len(self._key_info_cache) > self.KEY_INFO_CACHE_SIZE:
+                self._key_info_cache.popitem(last=False)
+        else:
+            self._key_info_cache.move_to_end(content)
         
+        # 返回副本，调用方修改结果不会影响缓存
+        return {key: list(values) for key, values in info.items()}
+    
+    def _extract_key_information(self, content: str) -> Dict[str, List[str]]:
+        """从内容中提取关键信息（不经过缓存）"""
+        # 简单实现：提取重要元素
         info = {
             "mentioned_characters": [],
             "important_events": [],
@@ -193,35 +246,33 @@ class SmartSummarizer:
         }
         
         # 提取可能的人物名称（中文名称，2-4字）
-        chinese_names = re.findall(r'[\u4e00-\u9fa5]{2,4}[\u4e00-\u9fa5]', content)
+        chinese_names = _NAME_RE.findall(content)
         info["mentioned_characters"] = list(set(chinese_names))[:10]  # 去重，最多10个
         
-        # 提取重要事件（包含动词的短句）
-        sentences = re.split(r'[。！？]', content)
-        important_sentences = []
-        
-        important_indicators = ['发现', '遇到', '战斗', '死亡', '获得', '失去', '决定', '承诺']
-        for sentence in sentences:
-            if any(indicator in sentence for indicator in important_indicators):
-                important_sentences.append(sentence.strip())
-        
-        info["important_events"] = important_sentences[:5]
-        
-        # 提取可能的新设定
-        setting_indicators = ['世界', '法则', '力量', '系统', '组织', '门派']
-        for sentence in sentences:
-            if any(indicator in sentence for indicator in setting_indicators):
-                info["new_settings"].append(sentence.strip())
-        
-        info["new_settings"] = info["new_settings"][:3]
-        
-        # 提取可能的伏笔
-        foreshadowing_indicators = ['未来', '将会', '可能', '似乎', '暗示', '预兆']
-        for sentence in sentences:
-            if any(indicator in sentence for indicator in foreshadowing_indicators):
-                info["potential_foreshadowing"].append(sentence.strip())
-        
-        info["potential_foreshadowing"] = info["potential_foreshadowing"][:3]
+        # 一次扫描全文，同时提取重要事件、新设定和伏笔：
+        # 先记下句末标点的位置，指示词命中后二分查找所在句子，只截取命中的句子
+        sentence_ends = [match.start() for match in _SENTENCE_SPLIT_RE.finditer(content)]
+        sentence_ends.append(len(content))
+        last_sentence = {}  # 类别 -> 最近收录的句子序号（同一句多次命中只收一次）
+        pending = len(_KEY_LIMITS)
+        for match in _INDICATOR_RE.finditer(content):
+            category = _INDICATOR_CATEGORY[match.group(1)]
+            found = info[category]
+            if len(found) >= _KEY_LIMITS[category]:
+                continue
+            
+            index = bisect.bisect_right(sentence_ends, match.start())
+            if last_sentence.get(category) == index:
+                continue
+            last_sentence[category] = index
+            
+            sentence_start = sentence_ends[index - 1] + 1 if index else 0
+            found.append(content[sentence_start:sentence_ends[index]].strip())
+            if len(found) == _KEY_LIMITS[category]:
+                pending -= 1
+                # 三类都已取满，后面的内容不用再看
+                if not pending:
+                    break
         
         return info
     
@@ -238,28 +289,27 @@ class SmartSummarizer:
         if not chapter_summaries:
             return "暂无阅读笔记"
         
-        notes = "📚 阅读笔记\n\n"
+        # 各段先收集到列表中，最后一次拼接
+        parts = ["📚 阅读笔记\n\n"]
         
         # 按章节组织笔记
         for i, summary in enumerate(chapter_summaries, 1):
-            notes += f"## 第{i}章\n"
-            notes += f"{summary.get('summary', '')}\n\n"
+            parts.append(f"## 第{i}章\n")
+            parts.append(f"{summary.get('summary', '')}\n\n")
             
             key_events = summary.get('key_events', [])
             if key_events:
-                notes += "关键事件:\n"
-                for event in key_events:
-                    notes += f"- {event}\n"
-                notes += "\n"
+                parts.append("关键事件:\n")
+                parts.extend(f"- {event}\n" for event in key_events)
+                parts.append("\n")
             
             character_dev = summary.get('character_development', {})
             if character_dev:
-                notes += "人物发展:\n"
-                for char, dev in character_dev.items():
-                    notes += f"- {char}: {dev}\n"
-                notes += "\n"
+                parts.append("人物发展:\n")
+                parts.extend(f"- {char}: {dev}\n" for char, dev in character_dev.items())
+                parts.append("\n")
         
-        return notes
+        return "".join(parts)
     
     def calculate_complexity_score(self, content: str) -> float:
         """
@@ -275,22 +325,17 @@ class SmartSummarizer:
             return 0.0
         
         # 简单复杂度计算
-        import re
-        
-        # 句子数量
-        sentences = re.split(r'[。！？]', content)
-        sentence_count = len([s for s in sentences if s.strip()])
+        # 句子数量（只计数，不生成过滤后的列表）
+        sentence_count = sum(1 for s in _SENTENCE_SPLIT_RE.split(content) if s and not s.isspace())
         
         # 段落数量
-        paragraphs = content.split('\n')
-        paragraph_count = len([p for p in paragraphs if p.strip()])
+        paragraph_count = sum(1 for p in content.split('\n') if p and not p.isspace())
         
         # 词汇多样性
-        words = re.findall(r'[\u4e00-\u9fa5]+', content)
-        unique_words = set(words)
+        words = _CHINESE_RE.findall(content)
         
         if words:
-            diversity = len(unique_words) / len(words)
+            diversity = len(set(words)) / len(words)
         else:
             diversity = 0
         
@@ -5,9 +5,11 @@ Million-Word-Novel-AI-Creator 主程序入口
 """
 
 import argparse
+import logging
 import sys
 import os
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 # 加载环境变量
@@ -19,7 +21,7 @@ sys.path.insert(0, str(project_root))
 
 from core.generator import NovelGenerator
 from core.memory_system import SmartMemory
-from utils.file_utils import ensure_directories
+from utils.file_utils import ensure_directories, write_file
 
 def parse_arguments():
     """解析命令行参数"""
@@ -96,19 +98,13 @@ def parse_arguments():
 def init_environment():
     """初始化环境"""
     # 确保必要的目录存在
-    directories = [
-        "./outputs",
+    ensure_directories(
         "./outputs/novels",
         "./outputs/outlines",
         "./outputs/logs",
-        "./memory",
-        "./memory/characters",
         "./memory/summaries",
         "./templates"
-    ]
-    
-    for directory in directories:
-        ensure_directories(directory)
+    )
     
     print("✅ 环境初始化完成")
 
@@ -168,6 +164,10 @@ def main():
     """主函数"""
     args = parse_arguments()
     
+    # 核心模块的状态信息走logging，命令行模式下原样输出到终端
+    logging.basicConfig(format="%(message)s")
+    logging.getLogger("core").setLevel(logging.INFO)
+    
     # 检查API密钥
     api_key = os.getenv("DEEPSEEK_API_KEY")
     if not api_key:
@@ -223,32 +223,47 @@ def main():
         
         print(f"✅ 人物生成完成: {len(characters)} 个角色")
         
-        # 生成章节
+        # 生成章节（章节写盘在后台线程进行，不阻塞下一章的生成请求）
         print(f"\n📖 正在生成前 {args.chapters} 章...")
-        for i in range(1, args.chapters + 1):
-            print(f"   正在生成第 {i} 章...")
-            
-            # 获取上下文
-            context = memory.get_context(i)
-            
-            # 生成章节
-            chapter = generator.generate_chapter(
-                chapter_number=i,
-                outline=outline,
-                characters=characters,
-                context=context,
-                target_words=3000
-            )
-            
-            # 保存章节
-            chapter_file = f"./outputs/novels/{outline.get('title', 'novel')}_chapter_{i}.txt"
-            with open(chapter_file, 'w', encoding='utf-8') as f:
-                f.write(chapter.get('content', ''))
-            
-            # 更新记忆
-            memory.update_with_chapter(i, chapter)
+        io_pool = ThreadPoolExecutor(max_workers=2)
+        try:
+            pending_writes = []
+            for i in range(1, args.chapters + 1):
+                print(f"   正在生成第 {i} 章...")
+                
+                # 获取上下文
+                context = memory.get_context(i)
+                
+                # 生成章节
+                chapter = generator.generate_chapter(
+                    chapter_number=i,
+                    outline=outline,
+                    characters=characters,
+                    context=context,
+                    target_words=3000
+                )
+                
+                # 保存章节
+                chapter_file = f"./outputs/novels/{outline.get('title', 'novel')}_chapter_{i}.txt"
+                content = chapter.get('content', '')
+                pending_writes.append((chapter_file, io_pool.submit(write_file, chapter_file, content)))
+                
+                # 更新记忆（下一章的上下文依赖于此，保持同步）
+                memory.update_with_chapter(i, chapter)
+                
+                print(f"   ✅ 第 {i} 章完成: {chapter.get('title', f'第{i}章')} ({len(content):,}字)")
             
-            print(f"   ✅ 第 {i} 章完成: {chapter.get('title', f'第{i}章')}")
+            # 逐个检查写盘结果，失败的章节文件要报告出来
+            for chapter_file, future in pending_writes:
+                try:
+                    saved = future.result()
+                except Exception as e:
+                    print(f"⚠️ 章节文件写入异常: {chapter_file} ({str(e)})")
+                    continue
+                if not saved:
+                    print(f"⚠️ 章节文件写入失败: {chapter_file}")
+        finally:
+            io_pool.shutdown(wait=True)
         
         print(f"\n🎉 小说生成完成!")
         print(f"   大纲文件: ./outputs/outlines/{outline.get('title', 'novel')}_outline.json")
@@ -80,11 +80,7 @@ def create_directories():
         "./outputs/outlines",
         "./outputs/logs",
         "./memory",
-        "./memory/characters",
         "./memory/summaries",
-        "./memory/relationships",
-        "./memory/plots",
-        "./memory/locations",
         "./memory/backups",
         "./templates",
         "./backups"
@@ -5,6 +5,8 @@
 from .file_utils import (
     save_json,
     load_json,
+    dumps_json,
+    loads_json,
     ensure_directories,
     list_files,
     read_file,
@@ -21,6 +23,8 @@ from .validators import (
 __all__ = [
     'save_json',
     'load_json', 
+    'dumps_json',
+    'loads_json',
     'ensure_directories',
     'list_files',
     'read_file',
@@ -9,22 +9,70 @@ from pathlib import Path
 from typing import Dict, List, Any, Optional
 from datetime import datetime
 
-def ensure_directories(directory_path: str) -> bool:
+# orjson为可选依赖（C实现，处理大段中文更快），未安装时回退到标准库json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 优先使用libyaml的C解析器，未编译时回退到纯Python实现
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
+
+def ensure_directories(*directory_paths: str) -> bool:
     """
     确保目录存在
     
     Args:
-        directory_path: 目录路径
+        *directory_paths: 一个或多个目录路径（父目录会自动创建）
         
     Returns:
-        是否成功
+        是否全部成功
     """
-    try:
-        os.makedirs(directory_path, exist_ok=True)
-        return True
-    except Exception as e:
-        print(f"创建目录失败: {directory_path}, 错误: {str(e)}")
-        return False
+    success = True
+    for directory_path in directory_paths:
+        try:
+            os.makedirs(directory_path, exist_ok=True)
+        except Exception as e:
+            print(f"创建目录失败: {directory_path}, 错误: {str(e)}")
+            success = False
+    return success
+
+def dumps_json(data: Any, indent: Optional[int] = 2) -> bytes:
+    """
+    序列化为UTF-8编码的JSON字节串
+    
+    Args:
+        data: 要序列化的数据
+        indent: 缩进空格数，None表示紧凑格式
+        
+    Returns:
+        JSON字节串
+    """
+    if orjson is not None and indent in (None, 2):
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, option=option)
+    # 紧凑格式与orjson一致，不在逗号、冒号后加空格
+    separators = (',', ':') if indent is None else None
+    return json.dumps(data, ensure_ascii=False, indent=indent, separators=separators).encode('utf-8')
+
+def loads_json(data: Any) -> Any:
+    """
+    解析JSON字节串或字符串
+    
+    Args:
+        data: JSON字节串或字符串
+        
+    Returns:
+        解析后的数据
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
 
 def save_json(data: Dict[str, Any], file_path: str, indent: int = 2) -> bool:
     """
@@ -44,8 +92,8 @@ def save_json(data: Dict[str, Any], file_path: str, indent: int = 2) -> bool:
         if directory:
             ensure_directories(directory)
         
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=indent)
+        with open(file_path, 'wb') as f:
+            f.write(dumps_json(data, indent=indent))
         
         return True
     except Exception as e:
@@ -66,8 +114,8 @@ def load_json(file_path: str) -> Optional[Dict[str, Any]]:
         if not os.path.exists(file_path):
             return None
         
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        with open(file_path, 'rb') as f:
+            return loads_json(f.read())
     except Exception as e:
         print(f"加载JSON文件失败: {file_path}, 错误: {str(e)}")
         return None
@@ -112,7 +160,7 @@ def load_yaml(file_path: str) -> Optional[Dict[str, Any]]:
             return None
         
         with open(file_path, 'r', encoding='utf-8') as f:
-            return yaml.safe_load(f)
+            return yaml.load(f, Loader=YamlLoader)
     except Exception as e:
         print(f"加载YAML文件失败: {file_path}, 错误: {str(e)}")
         return None